@@ -0,0 +1,100 @@
+import ctypes
+import logging
+import os
+import queue
+import sys
+import threading
+from time import monotonic
+from typing import Dict, Optional
+
+from playsound3 import playsound
+
+from settings import *
+
+# Constants
+NEW_SERVER_EVENT = "new_server"
+SERVER_FULL_EVENT = "server_full"
+NEW_SERVER_SOUND = "sound/new_server.mp3"
+SERVER_FULL_SOUND = "sound/server_full.mp3"
+DEFAULT_SOUNDS = {NEW_SERVER_EVENT: NEW_SERVER_SOUND, SERVER_FULL_EVENT: SERVER_FULL_SOUND}
+AUDIO_QUEUE_SIZE = 4
+
+logger = logging.getLogger(__name__)
+
+
+def send_mci_command(command: str) -> None:
+    error = ctypes.windll.winmm.mciSendStringW(command, None, 0, None)
+    if error != 0:
+        message = ctypes.create_unicode_buffer(256)
+        ctypes.windll.winmm.mciGetErrorStringW(error, message, len(message))
+        raise OSError(f"{command}: {message.value}")
+
+
+class MciSound:
+    # Stays opened by the Windows media control interface, so the file is only loaded and decoded once
+    def __init__(self, alias: str, path: str):
+        self.alias = alias
+        send_mci_command(f'open "{os.path.abspath(path)}" type mpegvideo alias {alias}')
+
+    def play(self) -> None:
+        # Restarts the sound if it is still playing
+        send_mci_command(f"play {self.alias} from 0")
+
+
+class PlaysoundSound:
+    # Used on other operating systems, where every play starts a new player
+    def __init__(self, path: str):
+        self.path = path
+
+    def play(self) -> None:
+        playsound(self.path, block=False)
+
+
+class AudioEngine:
+    # Plays notification sounds from a single worker thread, so the gui never waits for the audio backend
+    def __init__(self, sounds: Optional[Dict[str, str]] = None,
+                 min_interval: float = MIN_SOUND_INTERVAL_IN_SECONDS):
+        self.sound_files = sounds if sounds is not None else {**DEFAULT_SOUNDS, **CUSTOM_SOUNDS}
+        self.min_interval = min_interval
+        self.events = queue.Queue(AUDIO_QUEUE_SIZE)
+        self.queued_events = set()
+        self.last_played: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def play(self, event: str) -> None:
+        # Never blocks, events that are already queued or were played less than min_interval ago are dropped
+        now = monotonic()
+        with self.lock:
+            if event in self.queued_events or now - self.last_played.get(event, float('-inf')) < self.min_interval:
+                return
+            try:
+                self.events.put_nowait(event)
+            except queue.Full:
+                return
+            self.queued_events.add(event)
+            self.last_played[event] = now
+
+    def _load(self, event: str, path: str):
+        if sys.platform == 'win32':
+            try:
+                return MciSound(f"potato_{event}", path)
+            except OSError as e:
+                logger.warning(f"Could not preload the {event} sound, falling back to playsound: {e}")
+        return PlaysoundSound(path)
+
+    def _run(self) -> None:
+        # The sounds are loaded by the thread that plays them, before the first event arrives
+        sounds = {event: self._load(event, path) for event, path in self.sound_files.items()}
+        while True:
+            event = self.events.get()
+            with self.lock:
+                self.queued_events.discard(event)
+            sound = sounds.get(event)
+            if sound is None:
+                logger.warning(f"No sound for the {event} event")
+                continue
+            try:
+                sound.play()
+            except Exception as e:
+                logger.warning(f"Could not play the {event} sound: {e}")
@@ -0,0 +1,208 @@
+import argparse
+import dataclasses
+import json
+import multiprocessing
+import pickle
+import statistics
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+import http_client
+import potato_checker
+from delta import ServerListEncoder
+from messages import *
+from mock_potato_server import MockPotatoServer, make_progress
+from shared_table import SharedServerTable
+
+
+class BenchmarkResult:
+    def __init__(self, name: str, timings: List[float], items: int = 1, note: str = ""):
+        self.name = name
+        self.timings = timings
+        self.items = items
+        self.note = note
+
+    def to_dict(self) -> Dict[str, Any]:
+        if len(self.timings) == 0:
+            return {'name': self.name, 'note': self.note}
+        ordered = sorted(self.timings)
+        mean = statistics.mean(ordered)
+        return {'name': self.name,
+                'iterations': len(ordered),
+                'mean_ms': mean * 1000,
+                'median_ms': statistics.median(ordered) * 1000,
+                'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                'min_ms': ordered[0] * 1000,
+                'items_per_s': self.items / mean if mean > 0 else 0,
+                'note': self.note}
+
+
+def measure(name: str, function: Callable[[], Any], iterations: int, items: int = 1,
+            setup: Optional[Callable[[], Any]] = None, note: str = "") -> BenchmarkResult:
+    timings = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return BenchmarkResult(name, timings, items, note)
+
+
+def create_checker() -> potato_checker.PotatoChecker:
+    checker = potato_checker.PotatoChecker(None)
+    progress = make_progress(potato_checker.USER_STEAM_ID)['waveProgress']
+    checker._update_catalog(progress)
+    checker.user_uncompleted_missions = potato_checker.to_uncompleted_missions(progress)
+    return checker
+
+
+def bench_load_servers(iterations: int) -> List[BenchmarkResult]:
+    def clear_validators():
+        # Measure full downloads instead of 304 responses
+        http_client.client._validators.clear()
+
+    payload = http_client.client.session.get(potato_checker.SERVER_URL).content
+    return [measure("load_servers (fetch + decode)", potato_checker.load_servers, iterations,
+                    setup=clear_validators),
+            measure("load_servers (304 not modified)", potato_checker.load_servers, iterations),
+            measure("serverstatus json decode only", lambda: json.loads(payload), iterations,
+                    note=f"{len(payload)} bytes")]
+
+
+def bench_server_data_list(checker: potato_checker.PotatoChecker, servers: List[Dict[str, Any]],
+                           iterations: int) -> BenchmarkResult:
+    return measure("_to_server_data_list", lambda: checker._to_server_data_list(servers), iterations,
+                   items=len(servers), note="items are servers")
+
+
+def bench_server_status_pass(checker: potato_checker.PotatoChecker, servers: List[Dict[str, Any]],
+                             iterations: int) -> BenchmarkResult:
+    def forget_validators():
+        http_client.client.forget_validators(potato_checker.SERVER_URL)
+
+    return measure("_to_server_status (streamed single pass)",
+                   lambda: checker._to_server_status(potato_checker.stream_servers()), iterations,
+                   items=len(servers), setup=forget_validators, note="items are servers, includes the download")
+
+
+def bench_current_server(checker: potato_checker.PotatoChecker, servers: List[Dict[str, Any]],
+                         iterations: int) -> BenchmarkResult:
+    full_lobby = next(s for s in servers if len(s['steamIds']) == 6)
+
+    def clear_progress():
+        potato_checker.progress_cache.clear()
+
+    return measure("_enrich_current_server_data (full lobby)",
+                   lambda: checker._enrich_current_server_data(full_lobby, CurrentServerData()),
+                   iterations, setup=clear_progress, note="progress cache cleared before every run")
+
+
+def bench_queue_transfer(server_list: ServerDataList, iterations: int) -> List[BenchmarkResult]:
+    queue = multiprocessing.Queue()
+    snapshot = ServerListEncoder().encode(server_list)
+    # A delta where every server moved to the next wave
+    encoder = ServerListEncoder()
+    encoder.encode(server_list)
+    delta = encoder.encode(ServerDataList([dataclasses.replace(s, wave=s.wave + 1) for s in server_list.data]))
+
+    results = []
+    for name, message in [("queue transfer (snapshot)", snapshot), ("queue transfer (delta, all changed)", delta)]:
+        results.append(measure(name, lambda: queue.put(message) or queue.get(), iterations,
+                               note=f"{len(pickle.dumps(message))} bytes pickled"))
+    queue.close()
+    return results
+
+
+def bench_shared_table(server_list: ServerDataList, iterations: int) -> List[BenchmarkResult]:
+    table = SharedServerTable(create=True)
+    results = [measure("shared table publish", lambda: table.publish(server_list), iterations,
+                       items=len(server_list.data), note="items are servers"),
+               measure("shared table read", lambda: table.read().to_server_data_list(), iterations,
+                       items=len(server_list.data), note="items are servers")]
+    table.close()
+    table.unlink()
+    return results
+
+
+def bench_display_servers(server_list: ServerDataList, iterations: int) -> BenchmarkResult:
+    try:
+        from potato_gui import PotatoGui
+        gui = PotatoGui(multiprocessing.Queue())
+    except Exception as e:
+        return BenchmarkResult("PotatoGui._display_servers", [], note=f"skipped: {e}")
+
+    # Show every server
+    for variable in [gui.not_completed, gui.wave_1, gui.not_in_wave, gui.not_empty, gui.not_full]:
+        variable.set(False)
+    gui._update_filter()
+    # Alternate between two lists, so every run has to update labels
+    lists = [server_list.data,
+             [dataclasses.replace(s, player_count=(s.player_count + 1) % 7) for s in server_list.data]]
+    run = [0]
+
+    def display():
+        gui.all_servers_list = lists[run[0] % 2]
+        run[0] += 1
+        gui._display_servers()
+        gui.root.update_idletasks()
+
+    result = measure("PotatoGui._display_servers", display, iterations, items=len(server_list.data),
+                     note="items are servers")
+    gui.root.destroy()
+    return result
+
+
+def print_report(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]]) -> None:
+    print(f"{'benchmark':<45}{'mean ms':>10}{'p95 ms':>10}{'items/s':>12}{'vs base':>9}  note")
+    for r in results:
+        if 'mean_ms' not in r:
+            print(f"{r['name']:<45}{'':>41}  {r['note']}")
+            continue
+        comparison = ""
+        if baseline is not None and 'mean_ms' in baseline.get(r['name'], {}):
+            comparison = f"{r['mean_ms'] / baseline[r['name']]['mean_ms']:.2f}x"
+        print(f"{r['name']:<45}{r['mean_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['items_per_s']:>12.0f}{comparison:>9}  {r['note']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the checker pipeline against a local potato.tf stand-in")
+    parser.add_argument('--servers', type=int, default=1000, help="number of synthetic servers")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0, help="delay of every mock response in seconds")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of mock requests answered with 503")
+    parser.add_argument('--fixtures', default=None, help="directory with recorded responses, see mock_potato_server.py")
+    parser.add_argument('--json', default=None, help="write the results to this file")
+    parser.add_argument('--compare', default=None, help="results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    mock_server = MockPotatoServer(server_count=args.servers, latency=args.latency, error_rate=args.error_rate,
+                                   fixture_dir=args.fixtures)
+    base_url = mock_server.start()
+    potato_checker.SERVER_URL = f"{base_url}/api/serverstatus"
+    potato_checker.PROGRESS_URL = f"{base_url}/api/waveprogress?steamid="
+
+    all_servers = potato_checker.load_servers()
+    checker = create_checker()
+    server_list = checker._to_server_data_list(all_servers)
+
+    results: List[BenchmarkResult] = []
+    results += bench_load_servers(args.iterations)
+    results.append(bench_server_data_list(checker, all_servers, args.iterations))
+    results.append(bench_server_status_pass(checker, all_servers, args.iterations))
+    results.append(bench_current_server(checker, all_servers, args.iterations))
+    results += bench_queue_transfer(server_list, args.iterations)
+    results += bench_shared_table(server_list, args.iterations)
+    results.append(bench_display_servers(server_list, args.iterations))
+
+    result_dicts = [r.to_dict() for r in results]
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = {r['name']: r for r in json.load(f)['results']}
+    print(f"{len(all_servers)} servers, {args.iterations} iterations, {mock_server.request_count} mock requests")
+    print_report(result_dicts, baseline)
+
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'servers': len(all_servers), 'iterations': args.iterations, 'results': result_dicts}, f, indent=2)
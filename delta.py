@@ -0,0 +1,78 @@
+from dataclasses import fields, replace
+from typing import Dict, Optional, Union
+
+from messages import *
+
+# Constants
+RESYNC_INTERVAL = 30
+
+SERVER_DATA_FIELDS = [f.name for f in fields(ServerData)]
+
+ServerListMessage = Union[ServerListSnapshot, ServerListDelta]
+
+
+def _changed_fields(old: ServerData, new: ServerData) -> Dict[str, Any]:
+    return {name: getattr(new, name) for name in SERVER_DATA_FIELDS if getattr(old, name) != getattr(new, name)}
+
+
+class ServerListEncoder:
+    def __init__(self, resync_interval: int = RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self.sequence = 0
+        self._servers: Dict[str, ServerData] = {}
+        self._updates_until_resync = 0
+
+    def encode(self, servers: ServerDataList) -> Optional[ServerListMessage]:
+        # Returns None if nothing changed since the last message
+        new_servers = {s.address: s for s in servers.data}
+
+        if self._updates_until_resync <= 0:
+            message = ServerListSnapshot(self.sequence + 1, servers.data)
+            self._updates_until_resync = self.resync_interval
+        else:
+            added = [s for a, s in new_servers.items() if a not in self._servers]
+            removed = [a for a in self._servers if a not in new_servers]
+            changed = {}
+            for address, server in new_servers.items():
+                old = self._servers.get(address)
+                if old is not None and old != server:
+                    changed[address] = _changed_fields(old, server)
+            self._updates_until_resync -= 1
+            if len(added) == 0 and len(removed) == 0 and len(changed) == 0:
+                return None
+            message = ServerListDelta(self.sequence + 1, added, removed, changed)
+
+        self.sequence += 1
+        self._servers = new_servers
+        return message
+
+
+class ServerListDecoder:
+    def __init__(self):
+        self.sequence: Optional[int] = None
+        self.servers: Dict[str, ServerData] = {}
+
+    def apply(self, message: ServerListMessage) -> bool:
+        # Returns False if the message can't be applied, because a previous message is missing. The rows of the gui
+        # compare their servers themselves, so the changed addresses are not collected here
+        if isinstance(message, ServerListSnapshot):
+            self.servers = {s.address: s for s in message.data}
+            self.sequence = message.sequence
+            return True
+
+        if self.sequence is None or message.sequence != self.sequence + 1:
+            # Wait for the next snapshot
+            self.sequence = None
+            return False
+
+        for address in message.removed:
+            self.servers.pop(address, None)
+        for server in message.added:
+            self.servers[server.address] = server
+        for address, changed_fields in message.changed.items():
+            self.servers[address] = replace(self.servers[address], **changed_fields)
+        self.sequence = message.sequence
+        return True
+
+    def to_server_data_list(self) -> ServerDataList:
+        return ServerDataList(list(self.servers.values()))
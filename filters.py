@@ -0,0 +1,89 @@
+from functools import lru_cache
+from typing import Callable, Optional
+
+from messages import *
+from settings import *
+
+
+@lru_cache(maxsize=None)
+def get_difficulty_name(mission_name: str) -> str:
+    if mission_name.startswith("int"):
+        return "Intermediate"
+    elif mission_name.startswith("adv"):
+        return "Advanced"
+    elif mission_name.startswith("exp"):
+        return "Expert"
+    elif mission_name.startswith("rev") or mission_name.startswith("reverse"):
+        return "Reverse"
+    elif mission_name.startswith("mas"):
+        return "Master"
+    else:
+        return "Unknown"
+
+
+class FilterEngine:
+    def __init__(self,
+                 allowed_regions: List[str] = ALLOWED_REGIONS,
+                 allowed_maps: List[str] = ALLOWED_MAPS,
+                 allowed_difficulties: List[str] = ALLOWED_DIFFICULTIES,
+                 min_free_slots: int = MIN_FREE_SLOTS):
+        # Rules are stored as sets, so checking a server costs the same no matter how many entries a rule has
+        self.allowed_regions = frozenset(allowed_regions)
+        self.allowed_maps = frozenset(allowed_maps)
+        self.allowed_difficulties = frozenset(allowed_difficulties)
+        self.min_free_slots = min_free_slots
+        self.predicate: Callable[[ServerData], bool] = lambda s: True
+        # The last filtered server list, so it is only filtered once per update
+        self._cached_servers: Optional[List[ServerData]] = None
+        self._cached_filtered: List[ServerData] = []
+        self._cached_addresses: Set[str] = set()
+        self.compile(False, False, False, False, False)
+
+    def compile(self, not_in_wave: bool, wave_1: bool, not_completed: bool, not_empty: bool, not_full: bool) -> None:
+        # Combine the checkbox state and the user defined rules into a single predicate with only the active checks
+        checks: List[Callable[[ServerData], bool]] = []
+        if not_in_wave:
+            checks.append(lambda s: s.status != 'In-Wave')
+        if wave_1:
+            checks.append(lambda s: s.wave == 1)
+        if not_completed:
+            checks.append(lambda s: not s.completed)
+        if not_empty:
+            checks.append(lambda s: 0 < s.player_count)
+        min_free_slots = max(1 if not_full else 0, self.min_free_slots)
+        if min_free_slots > 0:
+            checks.append(lambda s: s.player_max_count - s.player_count >= min_free_slots)
+        if len(self.allowed_regions) > 0:
+            checks.append(lambda s: s.region in self.allowed_regions)
+        if len(self.allowed_maps) > 0:
+            checks.append(lambda s: s.map in self.allowed_maps)
+        if len(self.allowed_difficulties) > 0:
+            checks.append(lambda s: get_difficulty_name(s.mission_name) in self.allowed_difficulties)
+
+        if len(checks) == 0:
+            self.predicate = lambda s: True
+        elif len(checks) == 1:
+            self.predicate = checks[0]
+        else:
+            checks = tuple(checks)
+            self.predicate = lambda s: all(check(s) for check in checks)
+        self._cached_servers = None
+
+    def _filter_cached(self, servers: List[ServerData]) -> None:
+        if servers is not self._cached_servers:
+            self._cached_filtered = list(filter(self.predicate, servers))
+            self._cached_addresses = {s.address for s in self._cached_filtered}
+            self._cached_servers = servers
+
+    def filter(self, servers: List[ServerData]) -> List[ServerData]:
+        self._filter_cached(servers)
+        return self._cached_filtered
+
+    def filtered_addresses(self, servers: List[ServerData]) -> Set[str]:
+        self._filter_cached(servers)
+        return self._cached_addresses
+
+    def new_servers(self, old_servers: List[ServerData], new_servers: List[ServerData]) -> Set[str]:
+        # The old list was usually filtered during the previous update, so only the new list has to be filtered
+        old_addresses = self.filtered_addresses(old_servers)
+        return self.filtered_addresses(new_servers) - old_addresses
@@ -0,0 +1,377 @@
+import argparse
+import glob
+import logging
+import mmap
+import multiprocessing
+import os
+import statistics
+import struct
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from time import localtime, mktime, monotonic, sleep, strftime, strptime, time
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from delta import ServerListEncoder
+from messages import *
+from settings import *
+from shared_table import COLUMNS, STRING_COLUMNS, StringTable
+
+# Constants
+HISTORY_DIR = "history"
+DAY_FORMAT = "%Y-%m-%d"
+MAGIC = b"PSH2"
+# A keyframe stores every server and a fresh string table, so a file can be read from any keyframe on
+KEYFRAME_INTERVAL = 360
+# Frames further apart than this were not recorded in one run, the time in between is not counted
+MAX_GAP_IN_SECONDS = 3 * MAX_REFRESH_DELAY_IN_SECONDS
+
+# Record types
+RESET = 0
+STRING = 1
+FRAME = 2
+
+RESET_RECORD = struct.Struct('<B')
+STRING_HEADER = struct.Struct('<BH')
+# record type, time, keyframe, number of changed or added rows, number of removed addresses
+FRAME_HEADER = struct.Struct('<BdBHH')
+# String columns store the id of the string, all other columns are signed, because the api isn't guaranteed to only
+# send positive numbers
+ROW = struct.Struct('<' + ''.join('I' if name in STRING_COLUMNS else 'i' for name in COLUMNS))
+ADDRESS_ID = struct.Struct('<I')
+# time and file offset of a keyframe
+INDEX_ENTRY = struct.Struct('<dQ')
+
+logger = logging.getLogger(__name__)
+
+
+def history_paths(directory: str, day: str) -> Tuple[str, str]:
+    return os.path.join(directory, f"{day}.bin"), os.path.join(directory, f"{day}.idx")
+
+
+class HistoryRecorder:
+    # Appends every polled server list to a daily file, storing only the servers that changed since the last frame
+    def __init__(self, directory: str = HISTORY_DIR, days_kept: int = HISTORY_DAYS_KEPT):
+        self.directory = directory
+        self.days_kept = days_kept
+        self.day: Optional[str] = None
+        self.file: Optional[BinaryIO] = None
+        self.index_file: Optional[BinaryIO] = None
+        self.strings = StringTable()
+        self.rows: Dict[str, ServerData] = {}
+        self.previous_list: Optional[ServerDataList] = None
+        self.frames_since_keyframe = 0
+
+    def record(self, servers: ServerDataList, timestamp: Optional[float] = None) -> None:
+        timestamp = time() if timestamp is None else timestamp
+        try:
+            day = strftime(DAY_FORMAT, localtime(timestamp))
+            if day != self.day:
+                self._rotate(day)
+            self._write_frame(servers, timestamp)
+        except (OSError, struct.error) as e:
+            logger.warning(f"Could not record server list history: {e}")
+            # Start over with a keyframe in a fresh file handle
+            self.close()
+
+    def _rotate(self, day: str) -> None:
+        self.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path, index_path = history_paths(self.directory, day)
+        self.file = open(path, 'ab')
+        self.index_file = open(index_path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.day = day
+        self._delete_old_files()
+
+    def _delete_old_files(self) -> None:
+        oldest_day = strftime(DAY_FORMAT, localtime(time() - self.days_kept * 24 * 60 * 60))
+        for path in glob.glob(os.path.join(self.directory, "*.bin")) + glob.glob(os.path.join(self.directory, "*.idx")):
+            if os.path.splitext(os.path.basename(path))[0] < oldest_day:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    # e.g. while a replay still has the file mapped on Windows
+                    logger.warning(f"Could not delete old history file {path}: {e}")
+
+    def _write_frame(self, servers: ServerDataList, timestamp: float) -> None:
+        data = bytearray()
+        keyframe = self.frames_since_keyframe == 0
+        if keyframe:
+            self.strings = StringTable()
+            self.rows = {}
+            data += RESET_RECORD.pack(RESET)
+
+        if not keyframe and servers is self.previous_list:
+            # Unchanged lists are reused by the checker, so nothing has to be compared
+            changed = []
+            removed = []
+        else:
+            new_rows = {s.address: s for s in servers.data}
+            changed = [s for address, s in new_rows.items() if self.rows.get(address) != s]
+            removed = [address for address in self.rows if address not in new_rows]
+            self.rows = new_rows
+
+        string_count = len(self.strings.strings)
+        rows = [ROW.pack(*(self.strings.intern(getattr(s, name)) if name in STRING_COLUMNS else int(getattr(s, name))
+                           for name in COLUMNS))
+                for s in changed]
+        for s in self.strings.strings[string_count:]:
+            encoded = s.encode('utf-8')
+            data += STRING_HEADER.pack(STRING, len(encoded))
+            data += encoded
+        data += FRAME_HEADER.pack(FRAME, timestamp, keyframe, len(changed), len(removed))
+        for row in rows:
+            data += row
+        for address in removed:
+            data += ADDRESS_ID.pack(self.strings.ids[address])
+
+        offset = self.file.tell()
+        self.file.write(data)
+        # Flushed after every frame, so a replay can read the file while it is recorded
+        self.file.flush()
+        if keyframe:
+            self.index_file.write(INDEX_ENTRY.pack(timestamp, offset))
+            self.index_file.flush()
+        self.previous_list = servers
+        self.frames_since_keyframe = (self.frames_since_keyframe + 1) % KEYFRAME_INTERVAL
+
+    def close(self) -> None:
+        for f in [self.file, self.index_file]:
+            if f is not None:
+                f.close()
+        self.file = None
+        self.index_file = None
+        self.day = None
+        self.previous_list = None
+        self.frames_since_keyframe = 0
+
+
+class HistoryFile:
+    # Memory mapped reader of one daily history file
+    def __init__(self, path: str, index_path: str):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) > 0 else b""
+        self.keyframes: List[Tuple[float, int]] = []
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                index = f.read()
+            # A half written entry at the end is ignored
+            self.keyframes = list(INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % INDEX_ENTRY.size]))
+        self.keyframe_times = [t for t, _ in self.keyframes]
+
+    def frames(self, since: Optional[float] = None) -> Iterator[Tuple[float, bool, List[ServerData], List[str]]]:
+        # Yields the time, whether it is a keyframe, the changed or added servers and the removed addresses
+        if self.data[:len(MAGIC)] != MAGIC:
+            logger.warning("Skipping a history file with an unknown format")
+            return
+        position = len(MAGIC)
+        if since is not None:
+            # Start at the last keyframe before the requested time
+            i = bisect_right(self.keyframe_times, since) - 1
+            if i >= 0:
+                position = self.keyframes[i][1]
+        strings: List[str] = []
+
+        while position < len(self.data):
+            try:
+                record_type = self.data[position]
+                if record_type == RESET:
+                    strings = []
+                    position += RESET_RECORD.size
+                elif record_type == STRING:
+                    _, length = STRING_HEADER.unpack_from(self.data, position)
+                    position += STRING_HEADER.size
+                    if position + length > len(self.data):
+                        raise ValueError("truncated string")
+                    strings.append(self.data[position:position + length].decode('utf-8'))
+                    position += length
+                elif record_type == FRAME:
+                    _, timestamp, keyframe, changed_count, removed_count = FRAME_HEADER.unpack_from(self.data, position)
+                    position += FRAME_HEADER.size
+                    changed = []
+                    for _ in range(changed_count):
+                        changed.append(self._to_server_data(ROW.unpack_from(self.data, position), strings))
+                        position += ROW.size
+                    removed = []
+                    for _ in range(removed_count):
+                        removed.append(strings[ADDRESS_ID.unpack_from(self.data, position)[0]])
+                        position += ADDRESS_ID.size
+                    yield timestamp, bool(keyframe), changed, removed
+                else:
+                    raise ValueError(f"unknown record type {record_type}")
+            except (struct.error, ValueError, IndexError) as e:
+                # Continue at the next keyframe after a record that was cut off by a crash
+                i = bisect_right([offset for _, offset in self.keyframes], position)
+                if i == len(self.keyframes):
+                    if position < len(self.data):
+                        logger.warning(f"Skipping the unreadable end of a history file: {e}")
+                    return
+                position = self.keyframes[i][1]
+
+    @staticmethod
+    def _to_server_data(values: Tuple[int, ...], strings: List[str]) -> ServerData:
+        return ServerData(*(strings[value] if name in STRING_COLUMNS else bool(value) if name == 'completed' else value
+                            for name, value in zip(COLUMNS, values)))
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def is_wave_1_lobby(server: Optional[ServerData]) -> bool:
+    return server is not None and server.wave == 1 and server.status != "In-Wave" and server.player_count > 0
+
+
+class HistoryStore:
+    def __init__(self, directory: str = HISTORY_DIR):
+        self.directory = directory
+
+    def days(self, since: Optional[float] = None) -> List[str]:
+        days = sorted(os.path.splitext(os.path.basename(path))[0]
+                      for path in glob.glob(os.path.join(self.directory, "*.bin")))
+        if since is not None:
+            first_day = strftime(DAY_FORMAT, localtime(since))
+            days = [day for day in days if day >= first_day]
+        return days
+
+    def frames(self, since: Optional[float] = None) -> Iterator[Tuple[float, bool, List[ServerData], List[str]]]:
+        for i, day in enumerate(self.days(since)):
+            history_file = HistoryFile(*history_paths(self.directory, day))
+            try:
+                # Only the first file can start before the requested time
+                yield from history_file.frames(since if i == 0 else None)
+            finally:
+                history_file.close()
+
+    def _transitions(self, since: Optional[float] = None) \
+            -> Iterator[Tuple[float, float, List[Tuple[Optional[ServerData], Optional[ServerData]]], Dict[str, ServerData]]]:
+        # Yields the time of every frame, for how long the previous state lasted (0 after a gap or before since),
+        # the (old, new) servers that changed and the current state. Gone servers have no new and new servers no old value
+        state: Dict[str, ServerData] = {}
+        previous_time = None
+        for timestamp, keyframe, rows, removed in self.frames(since):
+            changes = []
+            if keyframe:
+                new_state = {s.address: s for s in rows}
+                changes += [(s, None) for address, s in state.items() if address not in new_state]
+                changes += [(state.get(s.address), s) for s in rows if state.get(s.address) != s]
+                state = new_state
+            else:
+                for address in removed:
+                    old = state.pop(address, None)
+                    if old is not None:
+                        changes.append((old, None))
+                for s in rows:
+                    changes.append((state.get(s.address), s))
+                    state[s.address] = s
+
+            duration = 0.0
+            if previous_time is not None and timestamp - previous_time <= MAX_GAP_IN_SECONDS:
+                duration = max(0.0, timestamp - max(previous_time, since or previous_time))
+            previous_time = timestamp
+            yield timestamp, duration, changes, state
+
+    def fill_rate(self, since: Optional[float] = None, by: str = 'region') -> Dict[str, float]:
+        # Time weighted average of how full the servers were, keyed by the given ServerData field
+        fill = defaultdict(float)
+        server_count = defaultdict(int)
+        fill_time = defaultdict(float)
+        server_time = defaultdict(float)
+        for _, duration, changes, _ in self._transitions(since):
+            # The sums are updated with the changes only, instead of summing all servers in every frame
+            if duration > 0:
+                for key, count in server_count.items():
+                    fill_time[key] += fill[key] * duration
+                    server_time[key] += count * duration
+            for old, new in changes:
+                if old is not None:
+                    fill[getattr(old, by)] -= old.player_count / max(1, old.player_max_count)
+                    server_count[getattr(old, by)] -= 1
+                if new is not None:
+                    fill[getattr(new, by)] += new.player_count / max(1, new.player_max_count)
+                    server_count[getattr(new, by)] += 1
+        return {key: fill_time[key] / server_time[key] for key in server_time if server_time[key] > 0}
+
+    def wave_1_lobbies_by_hour(self, since: Optional[float] = None, mission: Optional[str] = None) -> List[int]:
+        # Number of servers that became a wave 1 lobby in each hour of the day
+        lobbies = [0] * 24
+        for timestamp, duration, changes, _ in self._transitions(since):
+            if duration == 0:
+                continue
+            for old, new in changes:
+                if is_wave_1_lobby(new) and not is_wave_1_lobby(old) \
+                        and (mission is None or mission in (new.mission, new.mission_name)):
+                    lobbies[localtime(timestamp).tm_hour] += 1
+        return lobbies
+
+    def fill_times(self, since: Optional[float] = None, by: str = 'mission_name') -> Dict[str, float]:
+        # Median number of seconds from a wave 1 lobby appearing until it is full
+        lobby_started: Dict[str, float] = {}
+        durations = defaultdict(list)
+        for timestamp, duration, changes, _ in self._transitions(since):
+            if duration == 0:
+                # Lobbies are only timed if they appeared while recording
+                lobby_started.clear()
+                continue
+            for old, new in changes:
+                if not is_wave_1_lobby(new):
+                    lobby_started.pop((old or new).address, None)
+                elif new.player_count >= new.player_max_count:
+                    started = lobby_started.pop(new.address, None)
+                    if started is not None:
+                        durations[getattr(new, by)].append(timestamp - started)
+                elif not is_wave_1_lobby(old):
+                    lobby_started[new.address] = timestamp
+        return {key: statistics.median(values) for key, values in durations.items()}
+
+    def replay(self, message_queue: multiprocessing.Queue, since: Optional[float] = None, speed: float = 60) -> None:
+        # Sends the recorded server lists to the gui like the checker process does, speed times faster than recorded
+        encoder = ServerListEncoder()
+        for _, duration, _, state in self._transitions(since):
+            sleep(duration / speed)
+            message = encoder.encode(ServerDataList(list(state.values())))
+            if message is not None:
+                message.timestamps = {'queued': monotonic()}
+                message_queue.put(message)
+        logger.info("Replay finished")
+
+
+def parse_since(args: argparse.Namespace) -> Optional[float]:
+    if args.start is not None:
+        return mktime(strptime(args.start, "%Y-%m-%d %H:%M"))
+    return time() - args.days * 24 * 60 * 60 if args.days is not None else None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Queries and replays the server lists recorded with RECORD_HISTORY")
+    parser.add_argument('command', choices=['fill-rate', 'lobbies', 'fill-time', 'replay'])
+    parser.add_argument('--days', type=float, default=None, help="only use the last DAYS days (default: everything)")
+    parser.add_argument('--start', default=None, help="only use the history since this local time (YYYY-MM-DD HH:MM)")
+    parser.add_argument('--by', default='region', choices=['region', 'map', 'mission', 'mission_name'],
+                        help="group fill rates and fill times by this field")
+    parser.add_argument('--mission', default=None, help="only count lobbies of this mission")
+    parser.add_argument('--speed', type=float, default=60, help="replay this many times faster than recorded")
+    parser.add_argument('--directory', default=HISTORY_DIR)
+    args = parser.parse_args()
+
+    store = HistoryStore(args.directory)
+    since = parse_since(args)
+    if args.command == 'fill-rate':
+        for key, rate in sorted(store.fill_rate(since, args.by).items(), key=lambda item: -item[1]):
+            print(f"{key:<40}{rate:>8.1%}")
+    elif args.command == 'lobbies':
+        for hour, count in enumerate(store.wave_1_lobbies_by_hour(since, args.mission)):
+            print(f"{hour:02}:00 {count:>6} {'#' * count}")
+    elif args.command == 'fill-time':
+        for key, seconds in sorted(store.fill_times(since, args.by).items(), key=lambda item: item[1]):
+            print(f"{key:<40}{seconds / 60:>8.1f} min")
+    else:
+        # The gui is only needed for replays, queries also work without a display
+        from potato_gui import PotatoGui
+        replay_q = multiprocessing.Queue()
+        gui = PotatoGui(replay_q)
+        threading.Thread(target=store.replay, args=(replay_q, since, args.speed), daemon=True).start()
+        gui.mainloop()
@@ -0,0 +1,189 @@
+import codecs
+import json
+import random
+import threading
+from time import sleep
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from metrics import metrics
+from settings import MAX_CONCURRENT_REQUESTS
+
+# Constants
+CONNECT_TIMEOUT_IN_SECONDS = 3.05
+READ_TIMEOUT_IN_SECONDS = 10
+MAX_RETRIES = 3
+BACKOFF_BASE_IN_SECONDS = 0.5
+BACKOFF_MAX_IN_SECONDS = 8
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class HttpClient:
+    def __init__(self, pool_size: int = MAX_CONCURRENT_REQUESTS + 1):
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        # url -> (etag, last modified, decoded json)
+        self._validators: Dict[str, Tuple[Optional[str], Optional[str], Any]] = {}
+        # url -> (etag, last modified) of streamed responses, whose bodies are not kept
+        self._stream_validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._validators_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        # Created lazily, so the client can be created before the checker process is started
+        with self._session_lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                # gzip and deflate, and br with the Brotli package from requirements.txt
+                session.headers.update({'Accept-Encoding': ACCEPT_ENCODING, 'Connection': 'keep-alive'})
+                self._session = session
+            return self._session
+
+    def get_json(self, url: str, conditional: bool = False) -> Any:
+        # Conditional requests return the previously decoded body if the server responds with 304
+        headers = {}
+        cached = None
+        if conditional:
+            with self._validators_lock:
+                cached = self._validators.get(url)
+            if cached is not None:
+                etag, last_modified, _ = cached
+                if etag is not None:
+                    headers['If-None-Match'] = etag
+                if last_modified is not None:
+                    headers['If-Modified-Since'] = last_modified
+
+        endpoint = urlparse(url).path
+        try:
+            with metrics.timed(f"http_fetch {endpoint}"):
+                response = self._get(url, headers)
+            if response.status_code == 304 and cached is not None:
+                metrics.count_request(endpoint, False)
+                return cached[2]
+            response.raise_for_status()
+            with metrics.timed(f"json_decode {endpoint}"):
+                body = response.json()
+        except (requests.RequestException, ValueError):
+            metrics.count_request(endpoint, True)
+            raise
+        metrics.count_request(endpoint, False)
+
+        if conditional:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag is not None or last_modified is not None:
+                with self._validators_lock:
+                    self._validators[url] = (etag, last_modified, body)
+        return body
+
+    def stream_json_array(self, url: str) -> Optional[Iterator[Any]]:
+        # Returns None if the response didn't change since the previous call (304), otherwise an iterator that
+        # decodes the elements of the json array one by one while the response is downloaded
+        headers = {}
+        with self._validators_lock:
+            validators = self._stream_validators.get(url)
+        if validators is not None:
+            if validators[0] is not None:
+                headers['If-None-Match'] = validators[0]
+            if validators[1] is not None:
+                headers['If-Modified-Since'] = validators[1]
+
+        endpoint = urlparse(url).path
+        try:
+            with metrics.timed(f"http_fetch {endpoint}"):
+                response = self._get(url, headers, stream=True)
+            if response.status_code == 304 and validators is not None:
+                # Reading the empty body returns the connection to the pool, closing the response would drop it
+                response.content
+                metrics.count_request(endpoint, False)
+                return None
+            response.raise_for_status()
+        except requests.RequestException:
+            metrics.count_request(endpoint, True)
+            raise
+        metrics.count_request(endpoint, False)
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        return self._iter_json_array(url, response, (etag, last_modified))
+
+    def forget_validators(self, url: str) -> None:
+        # The next request for url downloads the full response again
+        with self._validators_lock:
+            self._validators.pop(url, None)
+            self._stream_validators.pop(url, None)
+
+    def _iter_json_array(self, url: str, response: requests.Response,
+                         validators: Tuple[Optional[str], Optional[str]]) -> Iterator[Any]:
+        decoder = json.JSONDecoder()
+        text_decoder = codecs.getincrementaldecoder('utf-8')()
+        chunks = response.iter_content(STREAM_CHUNK_SIZE)
+        buffer = ""
+        pos = 0
+        started = False
+        with response:
+            while True:
+                # Skip whitespace, the opening bracket and the commas between elements
+                while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ',' or
+                                             (not started and buffer[pos] == '[')):
+                    started = started or buffer[pos] == '['
+                    pos += 1
+                if started and pos < len(buffer) and buffer[pos] == ']':
+                    break
+                if started and pos < len(buffer):
+                    try:
+                        element, end = decoder.raw_decode(buffer, pos)
+                        pos = end
+                        yield element
+                        continue
+                    except json.JSONDecodeError:
+                        # The element is not complete yet
+                        pass
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise ValueError(f"Incomplete json array from {url}")
+                # Drop the decoded part of the buffer, so memory only depends on the size of one element
+                buffer = buffer[pos:] + text_decoder.decode(chunk)
+                pos = 0
+
+        # Only remember the validators once the whole array was read
+        if validators != (None, None):
+            with self._validators_lock:
+                self._stream_validators[url] = validators
+
+    def _get(self, url: str, headers: Dict[str, str], stream: bool = False) -> requests.Response:
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, headers=headers, stream=stream,
+                                            timeout=(CONNECT_TIMEOUT_IN_SECONDS, READ_TIMEOUT_IN_SECONDS))
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES:
+                    return response
+                # Read the error body of streamed responses too, so the connection can be reused for the retry
+                response.content
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= MAX_RETRIES:
+                    raise
+            # Full jitter backoff, so that retries of concurrent requests are spread out
+            sleep(random.uniform(0, min(BACKOFF_MAX_IN_SECONDS, BACKOFF_BASE_IN_SECONDS * 2 ** attempt)))
+            attempt += 1
+
+
+client = HttpClient()
+
+
+def get_json(url: str, conditional: bool = False) -> Any:
+    return client.get_json(url, conditional)
+
+
+def stream_json_array(url: str) -> Optional[Iterator[Any]]:
+    return client.stream_json_array(url)
@@ -1,17 +1,36 @@
+import logging
 import multiprocessing
 
+from metrics import metrics
 from potato_checker import PotatoChecker
 from potato_gui import PotatoGui
+from settings import SHARED_TABLE_NAME
+from shared_table import SharedServerTable
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(name)s: %(message)s")
 
 if __name__ == '__main__':
     message_q = multiprocessing.Queue()
     message_q.cancel_join_thread()
 
-    checker = PotatoChecker(message_q)
+    # Other programs can read the newest server list from this table, the gui gets it over the queue
+    shared_table = SharedServerTable(SHARED_TABLE_NAME, create=True) if SHARED_TABLE_NAME is not None else None
+
+    # The gui sends its timings to the checker process, which exports them
+    metrics_q = multiprocessing.Queue() if metrics.enabled else None
+
+    checker = PotatoChecker(message_q, SHARED_TABLE_NAME, metrics_q)
     checker_process = multiprocessing.Process(target=checker.mainloop)
-    gui = PotatoGui(message_q)
+    gui = PotatoGui(message_q, checker.servers)
 
     checker_process.start()
+    if metrics_q is not None:
+        # Only the gui process forwards, the checker process keeps the timings
+        metrics_q.cancel_join_thread()
+        metrics.forward_to(metrics_q)
     gui.mainloop()
 
     checker_process.kill()
+    if shared_table is not None:
+        shared_table.close()
+        shared_table.unlink()
@@ -1,8 +1,8 @@
 from dataclasses import dataclass, field
-from typing import List, Set, Tuple
+from typing import Any, Dict, List, Set, Tuple
 
 
-@dataclass
+@dataclass(slots=True)
 class ServerData:
     server_name: str
     region: str
@@ -16,6 +16,8 @@ class ServerData:
     wave: int
     max_wave: int
     address: str
+    # Number of other players on the server that still need its mission, only set if RANK_SERVERS is enabled
+    needed_by_players: int = 0
 
 
 @dataclass
@@ -23,6 +25,27 @@ class ServerDataList:
     data: List[ServerData]
 
 
+@dataclass
+class ServerListSnapshot:
+    sequence: int
+    data: List[ServerData]
+    # Monotonic times of the stages the list went through, for timing metrics
+    timestamps: Dict[str, float] = field(default_factory=dict)
+    # Number of user progress reloads the completed flags of the servers are based on
+    user_progress_version: int = 0
+
+
+@dataclass
+class ServerListDelta:
+    sequence: int
+    added: List[ServerData]
+    removed: List[str]
+    # address -> changed field names and their new values
+    changed: Dict[str, Dict[str, Any]]
+    timestamps: Dict[str, float] = field(default_factory=dict)
+    user_progress_version: int = 0
+
+
 @dataclass
 class CurrentServerData:
     region: str = ""
@@ -35,6 +58,8 @@ class CurrentServerData:
     player_max_count: int = 0
     player_steam_ids: Set[int] = field(default_factory=set)
     uncompleted_missions: List[Tuple[str, str, int]] = field(default_factory=list)
+    # True while the uncompleted missions are still being loaded for a new map, mission or player
+    pending: bool = False
 
     def is_empty(self):
         return self.region == ""
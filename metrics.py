@@ -0,0 +1,238 @@
+import cProfile
+import io
+import logging
+import multiprocessing
+import os
+import pstats
+import threading
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, strftime
+from typing import Any, ContextManager, Deque, Dict, Iterator, Optional, Tuple
+
+from settings import *
+
+# Constants
+BUCKETS_IN_SECONDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+PROFILE_DIR = "cache"
+# Quantiles in the summary and the recent quantiles in the Prometheus output only cover this time span
+WINDOW_IN_SECONDS = 300
+WINDOW_SLICES = 5
+RECENT_QUANTILES = [0.5, 0.95, 0.99]
+NO_OP_CONTEXT = nullcontext()
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    def __init__(self):
+        # The last bucket counts everything above the largest bucket boundary
+        self.bucket_counts = [0] * (len(BUCKETS_IN_SECONDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.bucket_counts[bisect_left(BUCKETS_IN_SECONDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket that contains the quantile
+        rank = q * self.count
+        seen = 0
+        for boundary, bucket_count in zip(BUCKETS_IN_SECONDS + [float('inf')], self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                return boundary
+        return float('inf')
+
+    def merge(self, other: 'Histogram') -> None:
+        self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, other.bucket_counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+
+class RollingHistogram:
+    # Cumulative histogram for Prometheus, and one histogram per time slice for the quantiles of the last window
+    def __init__(self, window: float = WINDOW_IN_SECONDS, slice_count: int = WINDOW_SLICES):
+        self.total = Histogram()
+        self.slice_length = window / slice_count
+        # (slice number, histogram) of the newest slices, older slices are dropped
+        self.slices: Deque[Tuple[int, Histogram]] = deque(maxlen=slice_count)
+
+    def observe(self, seconds: float, now: Optional[float] = None) -> None:
+        self.total.observe(seconds)
+        slice_number = int((monotonic() if now is None else now) // self.slice_length)
+        if len(self.slices) == 0 or self.slices[-1][0] != slice_number:
+            self.slices.append((slice_number, Histogram()))
+        self.slices[-1][1].observe(seconds)
+
+    def recent(self, now: Optional[float] = None) -> Histogram:
+        oldest_slice = int((monotonic() if now is None else now) // self.slice_length) - self.slices.maxlen + 1
+        recent = Histogram()
+        for slice_number, histogram in self.slices:
+            if slice_number >= oldest_slice:
+                recent.merge(histogram)
+        return recent
+
+
+class Metrics:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.histograms: Dict[str, RollingHistogram] = defaultdict(RollingHistogram)
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+        self.profile_requested = False
+        self._profiler: Optional[cProfile.Profile] = None
+        self._last_log = monotonic()
+        # Set in processes that don't export their metrics themselves, like the gui
+        self.forward_queue: Optional[multiprocessing.Queue] = None
+
+    def forward_to(self, queue: multiprocessing.Queue) -> None:
+        # Observations are sent to the process that exports them instead of being kept in this process
+        self.forward_queue = queue
+
+    def receive(self, queue: multiprocessing.Queue) -> None:
+        # Runs in a background thread of the exporting process and keeps the observations of forwarding processes
+        while True:
+            try:
+                stage, seconds = queue.get()
+            except (EOFError, OSError):
+                # The forwarding process was closed
+                return
+            self._record(stage, seconds)
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        if self.forward_queue is not None:
+            self.forward_queue.put((stage, seconds))
+        else:
+            self._record(stage, seconds)
+
+    def _record(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.histograms[stage].observe(seconds)
+
+    def timed(self, stage: str) -> ContextManager:
+        # A shared no-op context when disabled, so instrumented code costs almost nothing
+        if not self.enabled:
+            return NO_OP_CONTEXT
+        return self._timed(stage)
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, monotonic() - start)
+
+    def count_request(self, endpoint: str, error: bool) -> None:
+        if not self.enabled:
+            return
+        with self.lock:
+            self.requests[endpoint] += 1
+            if error:
+                self.errors[endpoint] += 1
+
+    def prometheus_text(self) -> str:
+        lines = []
+        with self.lock:
+            lines.append("# TYPE potato_stage_seconds histogram")
+            # Prometheus histograms are cumulative since the start, the window is applied when they are queried
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for boundary, bucket_count in zip(BUCKETS_IN_SECONDS + ["+Inf"], histogram.total.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'potato_stage_seconds_bucket{{stage="{stage}",le="{boundary}"}} {cumulative}')
+                lines.append(f'potato_stage_seconds_sum{{stage="{stage}"}} {histogram.total.sum}')
+                lines.append(f'potato_stage_seconds_count{{stage="{stage}"}} {histogram.total.count}')
+            lines.append("# TYPE potato_stage_recent_seconds gauge")
+            for stage, histogram in sorted(self.histograms.items()):
+                recent = histogram.recent()
+                if recent.count == 0:
+                    continue
+                for q in RECENT_QUANTILES:
+                    lines.append(f'potato_stage_recent_seconds{{stage="{stage}",quantile="{q}"}} {recent.quantile(q)}')
+            lines.append("# TYPE potato_requests_total counter")
+            for endpoint, count in sorted(self.requests.items()):
+                lines.append(f'potato_requests_total{{endpoint="{endpoint}"}} {count}')
+            lines.append("# TYPE potato_request_errors_total counter")
+            for endpoint, count in sorted(self.errors.items()):
+                lines.append(f'potato_request_errors_total{{endpoint="{endpoint}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        parts = []
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                recent = histogram.recent()
+                if recent.count == 0:
+                    continue
+                parts.append(f"{stage} n={recent.count} avg={recent.sum / recent.count * 1000:.1f}ms "
+                             f"p95<={recent.quantile(0.95) * 1000:.0f}ms")
+            for endpoint, count in sorted(self.requests.items()):
+                parts.append(f"{endpoint} requests={count} errors={self.errors[endpoint] / count:.1%}")
+        return "; ".join(parts)
+
+    def log_periodically(self) -> None:
+        # Called regularly by the main loops, logs at most once per METRICS_LOG_INTERVAL_IN_SECONDS
+        if not self.enabled or self.forward_queue is not None or METRICS_LOG_INTERVAL_IN_SECONDS <= 0:
+            return
+        if monotonic() - self._last_log >= METRICS_LOG_INTERVAL_IN_SECONDS:
+            self._last_log = monotonic()
+            logger.info(self.summary())
+
+    def apply_profiler_toggle(self) -> None:
+        # cProfile only profiles the thread that enables it, so this has to be called from the profiled loop
+        if self.profile_requested and self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            logger.info("Profiler started")
+        elif not self.profile_requested and self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"profile-{strftime('%Y%m%d-%H%M%S')}.prof")
+            self._profiler.dump_stats(path)
+            output = io.StringIO()
+            pstats.Stats(self._profiler, stream=output).sort_stats('cumulative').print_stats(20)
+            logger.info(f"Profiler stopped, saved to {path}\n{output.getvalue()}")
+            self._profiler = None
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            body = metrics.prometheus_text()
+        elif self.path == "/profile/start":
+            metrics.profile_requested = True
+            body = "Profiler starts with the next poll\n"
+        elif self.path == "/profile/stop":
+            metrics.profile_requested = False
+            body = "Profiler stops with the next poll\n"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_metrics_server(port: int) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+
+
+metrics = Metrics(METRICS_PORT is not None or METRICS_LOG_INTERVAL_IN_SECONDS > 0)
@@ -0,0 +1,165 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Constants
+REGIONS = ["EU", "USE", "USW", "USTX", "SGP", "AUS", "BRA"]
+MAPS = [f"mvm_map{i}" for i in range(20)]
+MISSION_PREFIXES = ["int", "adv", "exp", "rev", "mas"]
+MISSIONS_PER_MAP = 4
+STATUSES = ["Waiting", "In-Wave", "Between-Waves"]
+FIRST_STEAM_ID = 76561198000000000
+
+
+def make_catalog() -> List[Dict[str, str]]:
+    catalog = []
+    for map_name in MAPS:
+        for i in range(MISSIONS_PER_MAP):
+            mission = f"{MISSION_PREFIXES[i % len(MISSION_PREFIXES)]}_{map_name}_{i}"
+            catalog.append({'map': map_name, 'mapNiceName': map_name.replace("mvm_", "").title(),
+                            'mission': mission, 'missionNiceName': f"Mission {i} of {map_name}"})
+    return catalog
+
+
+def make_servers(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    catalog = make_catalog()
+    servers = []
+    next_steam_id = FIRST_STEAM_ID
+    for i in range(count):
+        mission = rng.choice(catalog)
+        players = rng.randint(0, 6)
+        steam_ids = list(range(next_steam_id, next_steam_id + players))
+        next_steam_id += players
+        max_wave = rng.randint(5, 8)
+        servers.append({'serverName': f"Potato Server #{i}",
+                        'region': rng.choice(REGIONS),
+                        'mapNoVersion': mission['map'],
+                        'mission': mission['mission'],
+                        'status': rng.choice(STATUSES),
+                        'playersRed': players,
+                        'playersBlu': 0,
+                        'playersConnecting': 0,
+                        'playersMax': 6,
+                        'steamIds': steam_ids,
+                        'wave': rng.randint(1, max_wave),
+                        'maxWave': max_wave,
+                        'address': f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:27015"})
+    return servers
+
+
+def make_progress(steam_id: int) -> Dict[str, Any]:
+    # Every player gets the same catalog with completed waves that only depend on the steam id
+    rng = random.Random(steam_id)
+    progress = []
+    for mission in make_catalog():
+        waves = rng.randint(5, 8)
+        progress.append(dict(mission, waveProgress=[rng.random() < 0.7 for _ in range(waves)]))
+    return {'waveProgress': progress}
+
+
+class MockPotatoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, server_count: int = 100, latency: float = 0, latency_jitter: float = 0,
+                 error_rate: float = 0, fixture_dir: Optional[str] = None, seed: int = 0):
+        super().__init__(("127.0.0.1", port), MockPotatoRequestHandler)
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.fixture_dir = fixture_dir
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.request_count = 0
+        if fixture_dir is not None:
+            with open(os.path.join(fixture_dir, "serverstatus.json"), encoding='utf-8') as f:
+                self.set_servers(json.load(f))
+        else:
+            self.set_servers(make_servers(server_count, seed))
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def set_servers(self, servers: List[Dict[str, Any]]) -> None:
+        self.server_status = json.dumps(servers).encode('utf-8')
+        self.server_status_etag = f'"{hashlib.sha1(self.server_status).hexdigest()}"'
+
+    def load_progress(self, steam_id: int) -> bytes:
+        if self.fixture_dir is not None:
+            path = os.path.join(self.fixture_dir, "waveprogress", f"{steam_id}.json")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        return json.dumps(make_progress(steam_id)).encode('utf-8')
+
+    def delay_and_fail(self) -> bool:
+        # Returns True if the request should fail
+        with self.rng_lock:
+            self.request_count += 1
+            delay = self.latency + self.rng.uniform(0, self.latency_jitter)
+            fail = self.rng.random() < self.error_rate
+        if delay > 0:
+            sleep(delay)
+        return fail
+
+    def start(self) -> str:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+
+class MockPotatoRequestHandler(BaseHTTPRequestHandler):
+    server: MockPotatoServer
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        if self.server.delay_and_fail():
+            self._send(503, b"")
+            return
+
+        url = urlparse(self.path)
+        if url.path == "/api/serverstatus":
+            if self.headers.get('If-None-Match') == self.server.server_status_etag:
+                self._send(304, b"")
+            else:
+                self._send(200, self.server.server_status, {'ETag': self.server.server_status_etag})
+        elif url.path == "/api/waveprogress":
+            steam_id = parse_qs(url.query).get('steamid', ["0"])[0]
+            self._send(200, self.server.load_progress(int(steam_id)))
+        else:
+            self._send(404, b"")
+
+    def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the potato.tf api")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--servers', type=int, default=100, help="number of synthetic servers")
+    parser.add_argument('--latency', type=float, default=0, help="delay of every response in seconds")
+    parser.add_argument('--jitter', type=float, default=0, help="additional random delay in seconds")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of requests answered with 503")
+    parser.add_argument('--fixtures', default=None,
+                        help="directory with a recorded serverstatus.json and waveprogress/<steam id>.json files")
+    args = parser.parse_args()
+
+    mock_server = MockPotatoServer(args.port, args.servers, args.latency, args.jitter, args.error_rate, args.fixtures)
+    print(f"Serving {mock_server.base_url}/api/serverstatus and {mock_server.base_url}/api/waveprogress")
+    mock_server.serve_forever()
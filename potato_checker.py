@@ -1,45 +1,84 @@
+import logging
 import multiprocessing
+import threading
 from collections import defaultdict
-from time import sleep
-from typing import Dict, Any, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import Dict, Any, Iterable, Iterator, Optional
 
 import requests
 
+from delta import ServerListEncoder
+from filters import FilterEngine
+from history import HistoryRecorder
+from http_client import client, get_json, stream_json_array
 from messages import *
+from metrics import metrics, start_metrics_server
+from progress_cache import ProgressCache
+from progress_index import ProgressIndex
+from scheduler import PollScheduler
 from settings import *
+from shared_table import SharedServerTable
+from snapshot import Snapshot, load_snapshot, save_snapshot
 
 # Constants
 SERVER_URL = "https://potato.tf/api/serverstatus"
 PROGRESS_URL = "https://potato.tf/api/waveprogress?steamid="
-REFRESH_DELAY_IN_SECONDS = 10
+# Players whose progress could not be loaded are retried at most this often, unless the players on the server change
+FAILED_PROGRESS_RETRY_DELAY_IN_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+progress_cache = ProgressCache(PROGRESS_CACHE_TTL_IN_SECONDS, PROGRESS_CACHE_SIZE)
 
 
 def load_servers() -> List[Dict[str, Any]]:
-    return requests.get(SERVER_URL).json()
+    return get_json(SERVER_URL, conditional=True)
+
+
+def stream_servers() -> Optional[Iterator[Dict[str, Any]]]:
+    # None if the server status didn't change since the previous call
+    return stream_json_array(SERVER_URL)
 
 
 def load_uncompleted_missions(steam_id: int = USER_STEAM_ID) -> Dict[str, Set[str]]:
+    uncompleted = progress_cache.get(steam_id)
+    if uncompleted is not None:
+        return uncompleted
+    uncompleted = to_uncompleted_missions(load_progress(steam_id))
+    progress_cache.put(steam_id, uncompleted)
+    return uncompleted
+
+
+def load_progress(steam_id: int) -> List[Dict[str, Any]]:
+    return get_json(f"{PROGRESS_URL}{steam_id}")['waveProgress']
+
+
+def to_uncompleted_missions(progress: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
     uncompleted = defaultdict(set)
-    progress = requests.get(f"{PROGRESS_URL}{steam_id}").json()['waveProgress']
     for mission in progress:
         if False in mission['waveProgress']:
             uncompleted[mission['map']].add(mission['mission'])
     return uncompleted
 
 
-def is_relevant_server(server: Dict[str, Set[str]]) -> bool:
-    return server['region'] not in IGNORED_REGIONS
-
-
-def is_current_server(server: Dict[str, Set[str]]) -> bool:
-    return USER_STEAM_ID in server['steamIds']
+def load_uncompleted_missions_concurrently(steam_ids: Iterable[int]) -> List[Optional[Dict[str, Set[str]]]]:
+    # The result of a player is None if their progress could not be loaded
+    steam_ids = list(steam_ids)
+    if len(steam_ids) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONCURRENT_REQUESTS, len(steam_ids)))) as executor:
+        futures = [executor.submit(load_uncompleted_missions, steam_id) for steam_id in steam_ids]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except (requests.RequestException, ValueError, KeyError):
+                results.append(None)
+        return results
 
 
-def player_needs_mission(uncompleted: Dict[str, Set[str]], mission: str) -> bool:
-    for ms in uncompleted.values():
-        if mission in ms:
-            return True
-    return False
+def is_relevant_server(server: Dict[str, Set[str]]) -> bool:
+    return server['region'] not in IGNORED_REGIONS
 
 
 def get_player_count(server: Dict[str, Any]) -> int:
@@ -55,95 +94,318 @@ class DefaultDict(defaultdict):
         return key
 
 
+@dataclass
+class ServerStatus:
+    servers: ServerDataList
+    current_server: Optional[Dict[str, Any]]
+    # Other players on the relevant servers, and all players on any server
+    relevant_steam_ids: Set[int]
+    all_steam_ids: Set[int]
+    user_progress_version: int
+
+
+class Mailbox:
+    # Holds only the newest value, take blocks until a value is put
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._value = None
+        self._has_value = False
+
+    def put(self, value: Any) -> None:
+        with self._condition:
+            self._value = value
+            self._has_value = True
+            self._condition.notify()
+
+    def take(self) -> Any:
+        with self._condition:
+            self._condition.wait_for(lambda: self._has_value)
+            self._has_value = False
+            return self._value
+
+
 class PotatoChecker:
-    def __init__(self, message_queue: multiprocessing.Queue):
+    def __init__(self, message_queue: multiprocessing.Queue, shared_table_name: Optional[str] = None,
+                 metrics_queue: Optional[multiprocessing.Queue] = None):
         self.message_queue = message_queue
-        self.map_to_nice_name = DefaultDict()
-        self.mission_to_nice_name = DefaultDict()
-        self.user_uncompleted_missions = load_uncompleted_missions()
-        self._load_maps_and_missions()
-
-    def _load_maps_and_missions(self):
-        all_missions = requests.get(f"{PROGRESS_URL}{USER_STEAM_ID}").json()['waveProgress']
-        for mission in all_missions:
+        # Timings of the gui, which are exported together with the timings of the checker
+        self.metrics_queue = metrics_queue
+        # Name of the shared memory block the newest server list is published to, if any
+        self.shared_table_name = shared_table_name
+        # Start from the snapshot of the last run, the data is refreshed once the checker process is running
+        snapshot = load_snapshot()
+        self.map_to_nice_name = DefaultDict(None, snapshot.map_to_nice_name)
+        self.mission_to_nice_name = DefaultDict(None, snapshot.mission_to_nice_name)
+        self.user_uncompleted_missions = snapshot.user_uncompleted_missions
+        # Incremented whenever the user progress is reloaded
+        self.user_progress_version = 0
+        self.servers = snapshot.servers
+        self.progress_index = ProgressIndex()
+        # Players whose progress could not be loaded -> monotonic time of the failure
+        self.failed_steam_ids: Dict[int, float] = {}
+
+    def _load_user_progress(self) -> None:
+        # The user progress also contains the nice names of all maps and missions, so a single request loads both
+        progress = load_progress(USER_STEAM_ID)
+        self._update_catalog(progress)
+        self.user_uncompleted_missions = to_uncompleted_missions(progress)
+        self.user_progress_version += 1
+        progress_cache.put(USER_STEAM_ID, self.user_uncompleted_missions)
+
+    def _update_catalog(self, progress: List[Dict[str, Any]]) -> None:
+        for mission in progress:
             self.map_to_nice_name[mission['map']] = mission['mapNiceName']
             self.mission_to_nice_name[mission['mission']] = mission['missionNiceName']
 
-    def _to_server_data_list(self, servers: Iterable[Dict[str, Any]]) -> ServerDataList:
-        to_data = lambda s: ServerData(s['serverName'],
-                                       s['region'],
-                                       self.map_to_nice_name[s['mapNoVersion']],
-                                       self.mission_to_nice_name[s['mission']],
-                                       s['mission'],
-                                       not s['mission'] in self.user_uncompleted_missions[s['mapNoVersion']],
-                                       s['status'],
-                                       get_player_count(s),
-                                       get_max_players(s),
-                                       s['wave'],
-                                       s['maxWave'],
-                                       s['address'])
-        return ServerDataList(list(map(to_data, servers)))
-
-    def _to_current_server_data(self, server: Dict[str, Any], previous_data: CurrentServerData) -> CurrentServerData:
-        map_no_version = server['mapNoVersion']
-        map_nice_name = self.map_to_nice_name[map_no_version]
-        mission_nice_name = self.mission_to_nice_name[server['mission']]
-        steam_ids = set(server['steamIds'])
-
-        # Load uncompleted missions for other players if the map or mission changed, or if a player joins or leaves,
-        # otherwise keep the loaded data from the previous iteration
-        if (previous_data.is_empty() or
-                previous_data.map != map_nice_name or
-                previous_data.mission != mission_nice_name or
-                previous_data.player_steam_ids != steam_ids):
-            uncompleted_missions_for_current_map = []
-            other_players_uncompleted_missions = []
-            for steam_id in server['steamIds']:
-                if steam_id == USER_STEAM_ID:
-                    continue
-                other_players_uncompleted_missions.append(load_uncompleted_missions(steam_id))
-
-            for m in self.user_uncompleted_missions[map_no_version]:
-                needed_by_other_players = 0
-                for other_player_uncompleted in other_players_uncompleted_missions:
-                    if m in other_player_uncompleted[map_no_version]:
-                        needed_by_other_players += 1
-                uncompleted_missions_for_current_map.append((self.mission_to_nice_name[m], m, needed_by_other_players))
-        else:
-            uncompleted_missions_for_current_map = previous_data.uncompleted_missions
+    def _save_snapshot(self) -> None:
+        # Called from both pipeline stages
+        with self.snapshot_lock:
+            save_snapshot(Snapshot(dict(self.map_to_nice_name),
+                                   dict(self.mission_to_nice_name),
+                                   self.user_uncompleted_missions,
+                                   self.servers))
+
+    def _to_server_data(self, s: Dict[str, Any]) -> ServerData:
+        return ServerData(s['serverName'],
+                          s['region'],
+                          self.map_to_nice_name[s['mapNoVersion']],
+                          self.mission_to_nice_name[s['mission']],
+                          s['mission'],
+                          not s['mission'] in self.user_uncompleted_missions.get(s['mapNoVersion'], ()),
+                          s['status'],
+                          get_player_count(s),
+                          get_max_players(s),
+                          s['wave'],
+                          s['maxWave'],
+                          s['address'],
+                          self._needed_by_players(s) if RANK_SERVERS else 0)
 
+    def _to_server_data_list(self, servers: Iterable[Dict[str, Any]]) -> ServerDataList:
+        return ServerDataList(list(map(self._to_server_data, servers)))
+
+    def _to_server_status(self, servers: Iterable[Dict[str, Any]]) -> ServerStatus:
+        # Single pass over the servers while they are decoded, only relevant servers are kept
+        user_progress_version = self.user_progress_version
+        data = []
+        current_server = None
+        relevant_steam_ids = set()
+        all_steam_ids = set()
+        for s in servers:
+            steam_ids = s['steamIds']
+            all_steam_ids.update(steam_ids)
+            if current_server is None and USER_STEAM_ID in steam_ids:
+                current_server = s
+            if is_relevant_server(s):
+                relevant_steam_ids.update(steam_ids)
+                data.append(self._to_server_data(s))
+        relevant_steam_ids.discard(USER_STEAM_ID)
+        return ServerStatus(ServerDataList(data), current_server, relevant_steam_ids, all_steam_ids,
+                            user_progress_version)
+
+    def _needed_by_players(self, server: Dict[str, Any]) -> int:
+        other_players = [steam_id for steam_id in server['steamIds'] if steam_id != USER_STEAM_ID]
+        return self.progress_index.demand(other_players, server['mapNoVersion'], server['mission'])
+
+    def _load_players_progress(self, steam_ids: Iterable[int]) -> List[Optional[Dict[str, Set[str]]]]:
+        steam_ids = list(steam_ids)
+        progress = load_uncompleted_missions_concurrently(steam_ids)
+        self.progress_index.update(steam_ids, progress)
+        # Replaced instead of changed, because the poller thread reads it
+        loaded = set(steam_ids)
+        failed = {steam_id: failed_at for steam_id, failed_at in self.failed_steam_ids.items() if steam_id not in loaded}
+        now = monotonic()
+        failed.update((steam_id, now) for steam_id, uncompleted in zip(steam_ids, progress) if uncompleted is None)
+        self.failed_steam_ids = failed
+        return progress
+
+    def _may_retry(self, steam_id: int) -> bool:
+        # False while the progress of the player failed to load less than FAILED_PROGRESS_RETRY_DELAY_IN_SECONDS ago
+        failed_at = self.failed_steam_ids.get(steam_id)
+        return failed_at is None or monotonic() - failed_at >= FAILED_PROGRESS_RETRY_DELAY_IN_SECONDS
+
+    def _failed_players_due(self, server: Dict[str, Any]) -> bool:
+        # True if a player on the server failed to load long enough ago to try again
+        return any(steam_id in self.failed_steam_ids and self._may_retry(steam_id) for steam_id in server['steamIds'])
+
+    def _server_status_inputs(self) -> Tuple[int, int, int]:
+        # Changes whenever the user progress is reloaded, new nice names are loaded or the ranking changes
+        return (self.user_progress_version,
+                len(self.map_to_nice_name) + len(self.mission_to_nice_name),
+                self.progress_index.version if RANK_SERVERS else 0)
+
+    def _progress_may_have_changed(self, server: Optional[Dict[str, Any]], previous_data: CurrentServerData) -> bool:
+        # Progress can only have changed on map or mission change, and on reset of wave
+        if previous_data.is_empty():
+            return False
+        return (server is None or
+                self.map_to_nice_name[server['mapNoVersion']] != previous_data.map or
+                self.mission_to_nice_name[server['mission']] != previous_data.mission or
+                server['wave'] < previous_data.wave)
+
+    def _needs_reload(self, server: Dict[str, Any], previous_data: CurrentServerData, progress_changed: bool) -> bool:
+        # Load uncompleted missions for other players if their progress may have changed, or if a player joins or
+        # leaves, otherwise keep the loaded data from the previous iteration
+        return (progress_changed or
+                previous_data.is_empty() or
+                previous_data.map != self.map_to_nice_name[server['mapNoVersion']] or
+                previous_data.mission != self.mission_to_nice_name[server['mission']] or
+                previous_data.player_steam_ids != set(server['steamIds']))
+
+    def _to_current_server_data(self, server: Dict[str, Any], uncompleted_missions: List[Tuple[str, str, int]],
+                                pending: bool = False) -> CurrentServerData:
         return CurrentServerData(server['region'],
-                                 map_nice_name,
-                                 mission_nice_name,
+                                 self.map_to_nice_name[server['mapNoVersion']],
+                                 self.mission_to_nice_name[server['mission']],
                                  server['mission'],
                                  server['wave'],
                                  server['maxWave'],
                                  get_player_count(server),
                                  get_max_players(server),
-                                 steam_ids,
-                                 uncompleted_missions_for_current_map)
-
-    def mainloop(self) -> None:
-        current_server = CurrentServerData()
+                                 set(server['steamIds']),
+                                 uncompleted_missions,
+                                 pending)
+
+    def _enrich_current_server_data(self, server: Dict[str, Any], previous_data: CurrentServerData,
+                                     progress_changed: bool = False) -> CurrentServerData:
+        # Retrying failed players doesn't go through _needs_reload, so the gui doesn't show them as loading again
+        if self._needs_reload(server, previous_data, progress_changed) or self._failed_players_due(server):
+            other_players = [steam_id for steam_id in server['steamIds'] if steam_id != USER_STEAM_ID]
+            self._load_players_progress(other_players)
+            uncompleted_missions_for_current_map = self._count_needed_missions(server, USER_STEAM_ID,
+                                                                               self.user_uncompleted_missions)
+            logger.info(progress_cache)
+        else:
+            uncompleted_missions_for_current_map = previous_data.uncompleted_missions
+        return self._to_current_server_data(server, uncompleted_missions_for_current_map)
 
+    def _count_needed_missions(self, server: Dict[str, Any], user_steam_id: int,
+                               user_uncompleted_missions: Dict[str, Set[str]]) -> List[Tuple[str, str, int]]:
+        # Uses the progress of the other players that is already in the progress index
+        map_no_version = server['mapNoVersion']
+        other_players = [steam_id for steam_id in server['steamIds'] if steam_id != user_steam_id]
+        return [(self.mission_to_nice_name[m], m, needed_by_other_players)
+                for m, needed_by_other_players in self.progress_index.demand_per_mission(
+                    other_players, map_no_version, user_uncompleted_missions.get(map_no_version, ()))]
+
+    def _enrichment_loop(self) -> None:
+        # Second stage of the pipeline, loads player progress without delaying the server list
+        user_progress_loaded = False
         while True:
-            all_servers = load_servers()
-
-            matching_servers = filter(is_relevant_server, all_servers)
-            self.message_queue.put(self._to_server_data_list(matching_servers))
+            server, relevant_steam_ids, all_steam_ids = self.enrichment_mailbox.take()
+            try:
+                if not user_progress_loaded:
+                    self._load_user_progress()
+                    user_progress_loaded = True
+                    self._save_snapshot()
+
+                # Drop cached progress of everyone who played on the server, and reload user progress
+                progress_changed = self._progress_may_have_changed(server, self.current_server)
+                if progress_changed:
+                    progress_cache.invalidate(self.current_server.player_steam_ids | {USER_STEAM_ID})
+                    self._load_user_progress()
+                    self._save_snapshot()
+
+                if server is not None:
+                    with metrics.timed("current_server_enrichment"):
+                        new_current_server = self._enrich_current_server_data(server, self.current_server, progress_changed)
+                else:
+                    new_current_server = CurrentServerData()
+                self.progress_index.retain(all_steam_ids)
+
+                self.current_server = new_current_server
+                self._publish_current_server(new_current_server)
+
+                if RANK_SERVERS:
+                    # Used for the server list of the next poll, loaded after the current server was published because
+                    # it can take many requests
+                    self._load_players_progress(relevant_steam_ids)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                logger.warning(f"Could not load player progress from potato.tf: {e}")
+
+    def _publish_pending_current_server(self, server: Optional[Dict[str, Any]]) -> None:
+        # Show the new state of the current server right away, the uncompleted missions follow once they are loaded
+        previous_data = self.current_server
+        if server is None or not self._needs_reload(server, previous_data, self._progress_may_have_changed(server, previous_data)):
+            return
+        same_map = previous_data.map == self.map_to_nice_name[server['mapNoVersion']]
+        self._publish_current_server(
+            self._to_current_server_data(server, previous_data.uncompleted_missions if same_map else [], pending=True))
+
+    def _publish_current_server(self, current_server: CurrentServerData) -> None:
+        # Called from both pipeline stages
+        with self.publish_lock:
+            if current_server != self.published_current_server:
+                self.message_queue.put(current_server)
+                self.published_current_server = current_server
 
-            new_current_server = next((self._to_current_server_data(s, current_server)
-                                       for s in all_servers if is_current_server(s)),
-                                      CurrentServerData())
-
-            # Reload user progress on map or mission change, and on reset of wave
-            if not current_server.is_empty():
-                if (new_current_server.map != current_server.map or
-                        new_current_server.mission != current_server.mission or
-                        new_current_server.wave < current_server.wave):
-                    self.user_uncompleted_missions = load_uncompleted_missions()
-            current_server = new_current_server
-
-            self.message_queue.put(current_server)
+    def mainloop(self) -> None:
+        self.current_server = CurrentServerData()
+        self.published_current_server = CurrentServerData()
+        self.snapshot_lock = threading.Lock()
+        self.publish_lock = threading.Lock()
+        self.enrichment_mailbox = Mailbox()
+        threading.Thread(target=self._enrichment_loop, daemon=True).start()
+
+        scheduler = PollScheduler(MIN_REFRESH_DELAY_IN_SECONDS, MAX_REFRESH_DELAY_IN_SECONDS)
+        encoder = ServerListEncoder()
+        shared_table = SharedServerTable(self.shared_table_name) if self.shared_table_name is not None else None
+        recorder = HistoryRecorder() if RECORD_HISTORY else None
+        if METRICS_PORT is not None:
+            start_metrics_server(METRICS_PORT)
+        if self.metrics_queue is not None:
+            threading.Thread(target=metrics.receive, args=(self.metrics_queue,), daemon=True).start()
+        status = None
+        status_inputs = None
+        # Joinable lobbies with their player counts, the poll interval only stays short while these change
+        lobby_filter = FilterEngine()
+        lobby_filter.compile(not_in_wave=True, wave_1=True, not_completed=True, not_empty=False, not_full=False)
+        lobbies = frozenset()
 
-            sleep(REFRESH_DELAY_IN_SECONDS)
+        while True:
+            metrics.apply_profiler_toggle()
+            metrics.log_periodically()
+            try:
+                # An unchanged server status can only be reused if the data it was combined with didn't change either
+                inputs = self._server_status_inputs()
+                if inputs != status_inputs:
+                    client.forget_validators(SERVER_URL)
+
+                fetch_started = monotonic()
+                with metrics.timed("server_status_pass"):
+                    stream = stream_servers()
+                    if stream is not None:
+                        status = self._to_server_status(stream)
+                        status_inputs = inputs
+                servers = status.servers
+                server = status.current_server
+                # Only the changes since the previous list are sent to the gui
+                message = encoder.encode(servers)
+                if message is not None:
+                    message.timestamps = {'fetch_started': fetch_started, 'queued': monotonic()}
+                    message.user_progress_version = status.user_progress_version
+                    self.message_queue.put(message)
+                    # Other programs can read the newest list from the shared table
+                    if shared_table is not None and not shared_table.publish(servers):
+                        logger.warning("Server list is too large for the shared server table")
+
+                if recorder is not None:
+                    with metrics.timed("history_record"):
+                        recorder.record(servers)
+
+                self._publish_pending_current_server(server)
+                # Only the newest server state is enriched if the enrichment is slower than polling
+                self.enrichment_mailbox.put((server, status.relevant_steam_ids, status.all_steam_ids))
+
+                if servers != self.servers:
+                    self.servers = servers
+                    self._save_snapshot()
+                new_lobbies = frozenset((s.address, s.player_count) for s in lobby_filter.filter(servers.data))
+                lobbies_changed = new_lobbies != lobbies
+                lobbies = new_lobbies
+                scheduler.update(lobbies_changed, server is not None and server['status'] != 'In-Wave')
+            except (requests.RequestException, ValueError, KeyError) as e:
+                # Keep showing the last known data while potato.tf can't be reached
+                logger.warning(f"Could not load data from potato.tf: {e}")
+                scheduler.update(False, False, error=True)
+
+            scheduler.wait()
@@ -1,18 +1,28 @@
 import ctypes
 import multiprocessing
+import sys
+import threading
 import tkinter.ttk as ttk
 import webbrowser
+from collections import deque
+from time import monotonic
 from tkinter import *
 from tkinter import font
+from typing import Callable, Optional
 
-from playsound3 import playsound
-
+from audio import NEW_SERVER_EVENT, SERVER_FULL_EVENT, AudioEngine
+from delta import ServerListDecoder
+from filters import FilterEngine, get_difficulty_name
 from messages import *
+from metrics import metrics
+from settings import RANK_SERVERS
 
 APP_WINDOW_TITLE = "Potato.tf Server Checker"
 APP_ICON = "images/potato.ico"
-NEW_SERVER_SOUND = "sound/new_server.mp3"
-SERVER_FULL_SOUND = "sound/server_full.mp3"
+NEW_DATA_EVENT = "<<NewData>>"
+
+DIFFICULTY_COLORS = {"Intermediate": 'gold', "Advanced": 'green3', "Expert": 'crimson', "Reverse": 'white',
+                     "Master": 'crimson', "Unknown": 'white'}
 
 BACKGROUND_COLOR = 'gray30'
 TEXT_COLOR = 'white'
@@ -30,8 +40,67 @@ WINDOW_HEIGHT = 600
 SERVER_FRAME_WIDTH = 920
 
 
+def get_difficulty(mission_name: str) -> Tuple[str, str]:
+    difficulty = get_difficulty_name(mission_name)
+    return difficulty, DIFFICULTY_COLORS[difficulty]
+
+
+def server_rank(server: ServerData) -> Tuple[int, int]:
+    # Servers whose mission is needed by the most players come first, then the fullest servers
+    return server.needed_by_players + (not server.completed) if RANK_SERVERS else 0, server.player_count
+
+
+class ServerRow:
+    def __init__(self, gui: 'PotatoGui', parent: Frame):
+        self.server: Optional[ServerData] = None
+        self.region_label = gui._create_label(parent, "")
+        self.map_label = gui._create_label(parent, "")
+        self.mission_label = gui._create_label(parent, "")
+        self.difficulty_label = gui._create_label(parent, "")
+        self.wave_label = gui._create_label(parent, "")
+        self.players_label = gui._create_label(parent, "")
+        self.connect_button = gui._create_connect_button(parent, lambda: self.server.address)
+        self.col_separators = [gui._create_col_separator(parent) for _ in range(6)]
+        self.row_separator = Frame(parent, bg=RELATED_SEPARATOR_COLOR, height=1)
+
+    def update(self, server: ServerData) -> None:
+        # Only reconfigure the labels whose text changed
+        old = self.server
+        if old is None or old.region != server.region:
+            self.region_label.configure(text=server.region)
+        if old is None or old.map != server.map:
+            self.map_label.configure(text=server.map)
+        if old is None or old.mission != server.mission:
+            self.mission_label.configure(text=server.mission)
+        if old is None or old.mission_name != server.mission_name:
+            difficulty, color = get_difficulty(server.mission_name)
+            self.difficulty_label.configure(text=difficulty, fg=color)
+        if old is None or (old.wave, old.max_wave) != (server.wave, server.max_wave):
+            self.wave_label.configure(text=f"W {server.wave}/{server.max_wave}")
+        if old is None or (old.player_count, old.player_max_count) != (server.player_count, server.player_max_count):
+            self.players_label.configure(text=f"P {server.player_count}/{server.player_max_count}")
+        self.server = server
+
+    def grid(self, i: int) -> None:
+        self.region_label.grid(row=i, column=0, padx=3, pady=2, sticky=W)
+        self.map_label.grid(row=i, column=2, padx=3, pady=2, sticky=W)
+        self.mission_label.grid(row=i, column=4, padx=3, pady=2, sticky=W)
+        self.difficulty_label.grid(row=i, column=6, padx=3, pady=2, sticky=W)
+        self.wave_label.grid(row=i, column=8, padx=3, pady=2)
+        self.players_label.grid(row=i, column=10, padx=3, pady=2)
+        self.connect_button.grid(row=i, column=12, padx=3, pady=2, sticky='ew')
+        for column, separator in zip(range(1, 12, 2), self.col_separators):
+            separator.grid(row=i, column=column)
+        self.row_separator.grid(row=i + 1, columnspan=13, sticky='ew')
+
+    def grid_remove(self) -> None:
+        for widget in [self.region_label, self.map_label, self.mission_label, self.difficulty_label, self.wave_label,
+                       self.players_label, self.connect_button, self.row_separator] + self.col_separators:
+            widget.grid_remove()
+
+
 class PotatoGui:
-    def __init__(self, message_queue: multiprocessing.Queue):
+    def __init__(self, message_queue: multiprocessing.Queue, cached_servers: Optional[ServerDataList] = None):
         self.root = Tk()
 
         self.active = BooleanVar(value=True)
@@ -43,31 +112,89 @@ class PotatoGui:
         self.not_empty = BooleanVar(value=True)
         self.not_full = BooleanVar(value=True)
 
+        # Loads the sounds in the background while the window is created
+        self.audio = AudioEngine()
+
         self.content_font = font.Font(family=FONT_FAMILY, size=CONTENT_FONT_SIZE)
         self.settings_font = font.Font(family=FONT_FAMILY, size=SETTINGS_FONT_SIZE)
         ttk.Style().configure("TCheckbutton", background=BACKGROUND_COLOR, foreground=TEXT_COLOR, font=self.settings_font)
 
         self.all_servers_list = None
+        # Version of the user progress of the last live server list, None until the first live list arrives
+        self.user_progress_version: Optional[int] = None
         self.current_server = CurrentServerData()
+        self.server_list_decoder = ServerListDecoder()
+        self.filter_engine = FilterEngine()
+        self._update_filter()
+        # Rows of the shown servers by address, and hidden rows that can be reused for other servers
+        self.server_rows: Dict[str, ServerRow] = {}
+        self.free_server_rows: List[ServerRow] = []
+        self.displayed_addresses: List[str] = []
 
         self._setup_gui()
-        self._check_for_new_data(message_queue)
-
-    def _check_for_new_data(self, server_q: multiprocessing.Queue) -> None:
-        while not server_q.empty():
-            server_obj = server_q.get(block=False)
-            if isinstance(server_obj, ServerDataList):
-                self._process_new_servers_list(server_obj)
+        self._display_current_server()
+        # Show the servers of the last run until the first update arrives
+        if cached_servers is not None:
+            self.all_servers_list = cached_servers.data
+            self._display_servers()
+        self.pending_messages = deque()
+        self.pending_lock = threading.Lock()
+        self.wakeup_scheduled = False
+        self.root.bind(NEW_DATA_EVENT, self._process_pending_messages)
+        # Start reading once the main loop is running, events can't be generated before that
+        self.root.after_idle(lambda: threading.Thread(target=self._read_queue, args=(message_queue,), daemon=True).start())
+
+    def _read_queue(self, server_q: multiprocessing.Queue) -> None:
+        # Runs in a background thread and only wakes up the gui when a message arrives
+        while True:
+            self.pending_messages.append(server_q.get())
+            with self.pending_lock:
+                if self.wakeup_scheduled:
+                    continue
+                self.wakeup_scheduled = True
+            try:
+                self.root.event_generate(NEW_DATA_EVENT, when='tail')
+            except (TclError, RuntimeError):
+                # The window was closed
+                return
+
+    def _process_pending_messages(self, event=None) -> None:
+        with self.pending_lock:
+            self.wakeup_scheduled = False
+        # Apply all queued updates, but only display the newest state
+        servers_changed = False
+        new_current_server = None
+        timestamps = {}
+        user_progress_version = None
+        while len(self.pending_messages) > 0:
+            server_obj = self.pending_messages.popleft()
+            if isinstance(server_obj, (ServerListSnapshot, ServerListDelta)):
+                timestamps = server_obj.timestamps
+                user_progress_version = server_obj.user_progress_version
+                if 'queued' in timestamps:
+                    metrics.observe("queue_hop", monotonic() - timestamps['queued'])
+                # Updates after a missing update are dropped until the next snapshot arrives
+                if self.server_list_decoder.apply(server_obj):
+                    servers_changed = True
             elif isinstance(server_obj, CurrentServerData):
-                self._process_new_current_server(server_obj)
-        # Rerun this method periodically
-        self.root.after(200, self._check_for_new_data, server_q)
-
-    def _process_new_servers_list(self, servers: ServerDataList) -> None:
-        if (self.all_servers_list is not None and self.new_server_sound.get() and
-                not (set([s.server_name for s in servers.data if self._server_filter(s)])
-                        .issubset(set([s.server_name for s in self.all_servers_list if self._server_filter(s)])))):
-            playsound(NEW_SERVER_SOUND, block=False)
+                new_current_server = server_obj
+        if servers_changed:
+            with metrics.timed("render_servers"):
+                self._process_new_servers_list(self.server_list_decoder.to_server_data_list(), user_progress_version)
+            if 'fetch_started' in timestamps:
+                metrics.observe("fetch_to_display", monotonic() - timestamps['fetch_started'])
+            metrics.log_periodically()
+        if new_current_server is not None:
+            self._process_new_current_server(new_current_server)
+
+    def _process_new_servers_list(self, servers: ServerDataList, user_progress_version: int) -> None:
+        # The first live list is compared with the cached list of the last run, and reloaded user progress changes
+        # which servers are uncompleted, so in both cases shown servers are not necessarily new
+        comparable = self.user_progress_version == user_progress_version
+        self.user_progress_version = user_progress_version
+        if (comparable and self.all_servers_list is not None and self.new_server_sound.get() and
+                len(self.filter_engine.new_servers(self.all_servers_list, servers.data)) > 0):
+            self.audio.play(NEW_SERVER_EVENT)
         self.all_servers_list = servers.data
         self._display_servers()
 
@@ -76,22 +203,25 @@ class PotatoGui:
                 (not server.is_empty()) and
                 self.current_server.player_count != server.player_count and
                 server.player_count == server.player_max_count):
-            playsound(SERVER_FULL_SOUND, block=False)
+            self.audio.play(SERVER_FULL_EVENT)
         self.current_server = server
         self._display_current_server()
 
-    def _server_filter(self, server: ServerData) -> bool:
-        return ((not self.not_in_wave.get() or server.status != 'In-Wave') and
-                (not self.wave_1.get() or server.wave == 1) and
-                (not self.not_completed.get() or not server.completed) and
-                (not self.not_empty.get() or 0 < server.player_count) and
-                (not self.not_full.get() or server.player_count < server.player_max_count))
+    def _update_filter(self) -> None:
+        self.filter_engine.compile(self.not_in_wave.get(), self.wave_1.get(), self.not_completed.get(),
+                                   self.not_empty.get(), self.not_full.get())
+
+    def _on_filter_changed(self) -> None:
+        self._update_filter()
+        self._display_servers()
 
     def _setup_gui(self) -> None:
         # Root window settings
         self.root.title(APP_WINDOW_TITLE)
-        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID('potato.server.checker')
-        self.root.iconbitmap(APP_ICON)
+        # The app id and .ico icon only exist on Windows, skipping them allows running headless elsewhere
+        if sys.platform == 'win32':
+            ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID('potato.server.checker')
+            self.root.iconbitmap(APP_ICON)
         self.root.geometry(f"{WINDOW_WIDTH}x{WINDOW_HEIGHT}")
         self.root.wm_minsize(WINDOW_WIDTH, WINDOW_HEIGHT)
         self.root.resizable(False, True)
@@ -119,6 +249,7 @@ class PotatoGui:
 
         self.server_canvas.create_window((0, 0), window=self.server_frame, anchor="nw", width=SERVER_FRAME_WIDTH, tags="server_frame")
         self.server_frame.bind("<Configure>", lambda e: self.server_canvas.configure(scrollregion=self.server_canvas.bbox("all")))
+        self.empty_server_placeholder = Frame(self.server_frame, bg=BACKGROUND_COLOR)
 
         self.server_canvas.grid(row=0, column=0, sticky='nsew')
         server_scrollbar.grid(row=0, column=1, sticky='ns')
@@ -127,6 +258,7 @@ class PotatoGui:
         self.curr_server_frame = Frame(self.content_frame, bg=BACKGROUND_COLOR)
         self.curr_server_frame.grid(row=0, column=2, sticky='new')
         self.curr_server_frame.columnconfigure(3, weight=1)
+        self._create_current_server_widgets()
 
         self.content_frame.pack(fill='both', expand=True)
         self.content_frame.rowconfigure(0, weight=1)
@@ -147,15 +279,15 @@ class PotatoGui:
         full_sound_checkbox.grid(row=0, column=4, columnspan=2, padx=3, pady=3, sticky='w')
 
         self._create_label(settings_frame, "Filter settings:", _font=self.settings_font).grid(row=1, column=0, padx=3, pady=3, sticky=W)
-        uncompleted_checkbox = ttk.Checkbutton(settings_frame, text="Uncompleted", variable=self.not_completed, command=self._display_servers)
+        uncompleted_checkbox = ttk.Checkbutton(settings_frame, text="Uncompleted", variable=self.not_completed, command=self._on_filter_changed)
         uncompleted_checkbox.grid(row=1, column=1, padx=3, pady=3, sticky='w')
-        wave_1_checkbox = ttk.Checkbutton(settings_frame, text="On wave 1", variable=self.wave_1, command=self._display_servers)
+        wave_1_checkbox = ttk.Checkbutton(settings_frame, text="On wave 1", variable=self.wave_1, command=self._on_filter_changed)
         wave_1_checkbox.grid(row=1, column=2, padx=3, pady=3, sticky='w')
-        not_in_wave_checkbox = ttk.Checkbutton(settings_frame, text="Not in wave", variable=self.not_in_wave, command=self._display_servers)
+        not_in_wave_checkbox = ttk.Checkbutton(settings_frame, text="Not in wave", variable=self.not_in_wave, command=self._on_filter_changed)
         not_in_wave_checkbox.grid(row=1, column=3, padx=3, pady=3, sticky='w')
-        not_empty_checkbox = ttk.Checkbutton(settings_frame, text="Not empty", variable=self.not_empty, command=self._display_servers)
+        not_empty_checkbox = ttk.Checkbutton(settings_frame, text="Not empty", variable=self.not_empty, command=self._on_filter_changed)
         not_empty_checkbox.grid(row=1, column=4, padx=3, pady=3, sticky='w')
-        not_full_checkbox = ttk.Checkbutton(settings_frame, text="Not full", variable=self.not_full, command=self._display_servers)
+        not_full_checkbox = ttk.Checkbutton(settings_frame, text="Not full", variable=self.not_full, command=self._on_filter_changed)
         not_full_checkbox.grid(row=1, column=5, padx=3, pady=3, sticky='w')
 
         settings_frame.columnconfigure(5, weight=1)
@@ -165,86 +297,132 @@ class PotatoGui:
         return Label(parent, bg=BACKGROUND_COLOR, font=_font if _font is not None else self.content_font, text=text,
                      fg=fg if fg is not None else TEXT_COLOR)
 
-    def _create_connect_button(self, address):
-        return Button(self.server_frame, text="Connect", command=lambda: webbrowser.open(f"steam://connect/{address}"),
+    def _create_connect_button(self, parent, get_address: Callable[[], str]) -> Button:
+        return Button(parent, text="Connect", command=lambda: webbrowser.open(f"steam://connect/{get_address()}"),
                       bg=CONNECT_BUTTON_COLOR, fg=TEXT_COLOR, activebackground=CONNECT_BUTTON_PRESSED_COLOR, activeforeground=TEXT_COLOR)
 
     def _create_difficulty_label(self, parent: Frame, mission_name: str) -> Label:
-        if mission_name.startswith("int"):
-            return self._create_label(parent, "Intermediate", 'gold')
-        elif mission_name.startswith("adv"):
-            return self._create_label(parent, "Advanced", 'green3')
-        elif mission_name.startswith("exp"):
-            return self._create_label(parent, "Expert", 'crimson')
-        elif mission_name.startswith("rev") or mission_name.startswith("reverse"):
-            return self._create_label(parent, "Reverse", 'white')
-        elif mission_name.startswith("mas"):
-            return self._create_label(parent, "Master", 'crimson')
-        else:
-            return self._create_label(parent, "Unknown", 'white')
+        return self._create_label(parent, *get_difficulty(mission_name))
 
-    def _create_col_separator(self) -> Frame:
-        return Frame(self.server_frame, bg=RELATED_SEPARATOR_COLOR, width=1, height=20)
+    def _create_col_separator(self, parent) -> Frame:
+        return Frame(parent, bg=RELATED_SEPARATOR_COLOR, width=1, height=20)
 
     def _display_servers(self):
-        for child in self.server_frame.winfo_children():
-            child.destroy()
         if self.all_servers_list is None:
             return
-        filtered_servers = list(filter(self._server_filter, self.all_servers_list))
-        if not len(filtered_servers) == 0:
-            i = 0
-            for server in sorted(filtered_servers, key=lambda s: s.player_count, reverse=True):
-                self._create_label(self.server_frame, server.region).grid(row=i, column=0, padx=3, pady=2, sticky=W)
-                self._create_col_separator().grid(row=i, column=1)
-                self._create_label(self.server_frame, server.map).grid(row=i, column=2, padx=3, pady=2, sticky=W)
-                self._create_col_separator().grid(row=i, column=3)
-                self._create_label(self.server_frame, server.mission).grid(row=i, column=4, padx=3, pady=2, sticky=W)
-                self._create_col_separator().grid(row=i, column=5)
-                self._create_difficulty_label(self.server_frame, server.mission_name).grid(row=i, column=6, padx=3, pady=2, sticky=W)
-                self._create_col_separator().grid(row=i, column=7)
-                self._create_label(self.server_frame, f"W {server.wave}/{server.max_wave}").grid(row=i, column=8, padx=3, pady=2)
-                self._create_col_separator().grid(row=i, column=9)
-                self._create_label(self.server_frame, f"P {server.player_count}/{server.player_max_count}").grid(row=i, column=10, padx=3, pady=2)
-                self._create_col_separator().grid(row=i, column=11)
-                self._create_connect_button(server.address).grid(row=i, column=12, padx=3, pady=2, sticky='ew')
-                Frame(self.server_frame, bg=RELATED_SEPARATOR_COLOR, height=1).grid(row=i + 1, columnspan=13, sticky='ew')
-                i += 2
-        else:
+        filtered_servers = sorted(self.filter_engine.filter(self.all_servers_list), key=server_rank, reverse=True)
+        addresses = [s.address for s in filtered_servers]
+
+        # Hide the rows of servers that are no longer shown and keep them for reuse
+        shown_addresses = set(addresses)
+        for address in [a for a in self.server_rows if a not in shown_addresses]:
+            row = self.server_rows.pop(address)
+            row.grid_remove()
+            self.free_server_rows.append(row)
+
+        for server in filtered_servers:
+            row = self.server_rows.get(server.address)
+            if row is None:
+                row = self.free_server_rows.pop() if self.free_server_rows else ServerRow(self, self.server_frame)
+                self.server_rows[server.address] = row
+            row.update(server)
+
+        # Rows only have to be moved if the order of the shown servers changed
+        if addresses != self.displayed_addresses:
+            for i, address in enumerate(addresses):
+                self.server_rows[address].grid(i * 2)
+            self.displayed_addresses = addresses
+
+        if len(filtered_servers) == 0:
             # Update the server frame to force the frame to resize
-            Frame(self.server_frame, bg=BACKGROUND_COLOR).grid(row=0)
+            self.empty_server_placeholder.grid(row=0)
+        else:
+            self.empty_server_placeholder.grid_remove()
 
-    def _display_current_server(self):
-        for child in self.curr_server_frame.winfo_children():
-            child.destroy()
+    def _create_current_server_widgets(self) -> None:
         self._create_label(self.curr_server_frame, "Currently playing").grid(row=0, column=0, padx=3, pady=2, columnspan=4, sticky=N)
         Frame(self.curr_server_frame, bg=RELATED_SEPARATOR_COLOR, height=1).grid(row=1, columnspan=4, sticky='ew')
 
-        if not self.current_server.is_empty():
-            self._create_label(self.curr_server_frame, f"Map:").grid(row=2, column=0, padx=3, pady=2, sticky=W)
-            self._create_label(self.curr_server_frame, self.current_server.map).grid(row=2, column=1, columnspan=2, padx=3, pady=2, sticky=W)
-
-            self._create_label(self.curr_server_frame, f"Mission:").grid(row=3, column=0, padx=3, pady=2, sticky=W)
-            self._create_difficulty_label(self.curr_server_frame, self.current_server.mission_name).grid(row=3, column=1, padx=3, pady=2, sticky=W)
-            self._create_label(self.curr_server_frame, self.current_server.mission).grid(row=3, column=2, padx=3, pady=2, sticky=W)
-            Frame(self.curr_server_frame, bg=RELATED_SEPARATOR_COLOR, height=1).grid(row=4, columnspan=4, sticky='ew')
-            Frame(self.curr_server_frame, bg=BACKGROUND_COLOR, height=25).grid(row=5, columnspan=4, sticky='ew')
-
-            if not len(self.current_server.uncompleted_missions) == 0:
-                self._create_label(self.curr_server_frame, "Uncompleted missions on this map (needed by # other players)").grid(row=6, column=0, padx=3, pady=2, columnspan=4, sticky='s')
-                Frame(self.curr_server_frame, bg=RELATED_SEPARATOR_COLOR, height=1).grid(row=7, columnspan=4, sticky='ew')
-
-                uncompleted_missions_frame = Frame(self.curr_server_frame, bg=BACKGROUND_COLOR)
-                uncompleted_missions_frame.grid(row=8, columnspan=4, sticky='new')
-                uncompleted_missions_frame.columnconfigure(3, weight=1)
-
-                i = 0
-                for mission in sorted(self.current_server.uncompleted_missions, key=lambda m: m[2], reverse=True):
-                    self._create_difficulty_label(uncompleted_missions_frame, mission[1]).grid(row=i, column=0, padx=3, pady=2, sticky=W)
-                    self._create_label(uncompleted_missions_frame, mission[0]).grid(row=i, column=1, padx=3, pady=2, sticky=W)
-                    self._create_label(uncompleted_missions_frame, f"({mission[2]})").grid(row=i, column=2, padx=3, pady=2, sticky=W)
-                    Frame(uncompleted_missions_frame, bg=RELATED_SEPARATOR_COLOR, height=1).grid(row=i + 1, columnspan=4, sticky='ew')
-                    i += 2
+        self.curr_map_label = self._create_label(self.curr_server_frame, "")
+        self.curr_difficulty_label = self._create_label(self.curr_server_frame, "")
+        self.curr_mission_label = self._create_label(self.curr_server_frame, "")
+        self.curr_server_widgets = [
+            self._create_label(self.curr_server_frame, f"Map:"),
+            self.curr_map_label,
+            self._create_label(self.curr_server_frame, f"Mission:"),
+            self.curr_difficulty_label,
+            self.curr_mission_label,
+            Frame(self.curr_server_frame, bg=RELATED_SEPARATOR_COLOR, height=1),
+            Frame(self.curr_server_frame, bg=BACKGROUND_COLOR, height=25)]
+        self.curr_server_widgets[0].grid(row=2, column=0, padx=3, pady=2, sticky=W)
+        self.curr_map_label.grid(row=2, column=1, columnspan=2, padx=3, pady=2, sticky=W)
+        self.curr_server_widgets[2].grid(row=3, column=0, padx=3, pady=2, sticky=W)
+        self.curr_difficulty_label.grid(row=3, column=1, padx=3, pady=2, sticky=W)
+        self.curr_mission_label.grid(row=3, column=2, padx=3, pady=2, sticky=W)
+        self.curr_server_widgets[5].grid(row=4, columnspan=4, sticky='ew')
+        self.curr_server_widgets[6].grid(row=5, columnspan=4, sticky='ew')
+
+        self.uncompleted_missions_frame = Frame(self.curr_server_frame, bg=BACKGROUND_COLOR)
+        self.uncompleted_missions_frame.columnconfigure(3, weight=1)
+        self.uncompleted_missions_label = self._create_label(self.curr_server_frame, "")
+        self.uncompleted_missions_widgets = [
+            self.uncompleted_missions_label,
+            Frame(self.curr_server_frame, bg=RELATED_SEPARATOR_COLOR, height=1),
+            self.uncompleted_missions_frame]
+        self.uncompleted_missions_widgets[0].grid(row=6, column=0, padx=3, pady=2, columnspan=4, sticky='s')
+        self.uncompleted_missions_widgets[1].grid(row=7, columnspan=4, sticky='ew')
+        self.uncompleted_missions_frame.grid(row=8, columnspan=4, sticky='new')
+        # (difficulty, mission, needed by, separator) labels, reused for every shown mission
+        self.uncompleted_mission_rows: List[Tuple[Label, Label, Label, Frame]] = []
+
+    def _display_current_server(self):
+        if self.current_server.is_empty():
+            for widget in self.curr_server_widgets + self.uncompleted_missions_widgets:
+                widget.grid_remove()
+            return
+
+        for widget in self.curr_server_widgets:
+            widget.grid()
+        self.curr_map_label.configure(text=self.current_server.map)
+        difficulty, color = get_difficulty(self.current_server.mission_name)
+        self.curr_difficulty_label.configure(text=difficulty, fg=color)
+        self.curr_mission_label.configure(text=self.current_server.mission)
+
+        if len(self.current_server.uncompleted_missions) == 0 and not self.current_server.pending:
+            for widget in self.uncompleted_missions_widgets:
+                widget.grid_remove()
+            return
+
+        for widget in self.uncompleted_missions_widgets:
+            widget.grid()
+        if self.current_server.pending:
+            self.uncompleted_missions_label.configure(text="Loading uncompleted missions on this map...")
+        else:
+            self.uncompleted_missions_label.configure(text="Uncompleted missions on this map (needed by # other players)")
+        missions = sorted(self.current_server.uncompleted_missions, key=lambda m: m[2], reverse=True)
+        while len(self.uncompleted_mission_rows) < len(missions):
+            i = len(self.uncompleted_mission_rows) * 2
+            row = (self._create_label(self.uncompleted_missions_frame, ""),
+                   self._create_label(self.uncompleted_missions_frame, ""),
+                   self._create_label(self.uncompleted_missions_frame, ""),
+                   Frame(self.uncompleted_missions_frame, bg=RELATED_SEPARATOR_COLOR, height=1))
+            row[0].grid(row=i, column=0, padx=3, pady=2, sticky=W)
+            row[1].grid(row=i, column=1, padx=3, pady=2, sticky=W)
+            row[2].grid(row=i, column=2, padx=3, pady=2, sticky=W)
+            row[3].grid(row=i + 1, columnspan=4, sticky='ew')
+            self.uncompleted_mission_rows.append(row)
+
+        for i, row in enumerate(self.uncompleted_mission_rows):
+            if i < len(missions):
+                difficulty, color = get_difficulty(missions[i][1])
+                row[0].configure(text=difficulty, fg=color)
+                row[1].configure(text=missions[i][0])
+                row[2].configure(text=f"({missions[i][2]})")
+                for widget in row:
+                    widget.grid()
+            else:
+                for widget in row:
+                    widget.grid_remove()
 
     def mainloop(self):
         self.root.mainloop()
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+class ProgressCache:
+    def __init__(self, ttl_in_seconds: float, max_size: int):
+        self.ttl_in_seconds = ttl_in_seconds
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # steam id -> (time of loading, uncompleted missions), least recently used first
+        self._entries: OrderedDict[int, Tuple[float, Dict[str, Set[str]]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, steam_id: int) -> Optional[Dict[str, Set[str]]]:
+        with self._lock:
+            entry = self._entries.get(steam_id)
+            if entry is None or monotonic() - entry[0] > self.ttl_in_seconds:
+                if entry is not None:
+                    del self._entries[steam_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(steam_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, steam_id: int, uncompleted: Dict[str, Set[str]]) -> None:
+        with self._lock:
+            self._entries[steam_id] = (monotonic(), uncompleted)
+            self._entries.move_to_end(steam_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, steam_ids: Iterable[int]) -> None:
+        with self._lock:
+            for steam_id in steam_ids:
+                self._entries.pop(steam_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total > 0 else 0
+        return f"progress cache: {len(self._entries)} entries, {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
@@ -0,0 +1,67 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class MissionTable:
+    def __init__(self):
+        # (map, mission) -> bit of the mission in the progress bitsets
+        self.bits: Dict[Tuple[str, str], int] = {}
+
+    def bit(self, map_name: str, mission: str) -> int:
+        key = (map_name, mission)
+        bit = self.bits.get(key)
+        if bit is None:
+            bit = len(self.bits)
+            self.bits[key] = bit
+        return bit
+
+
+class ProgressIndex:
+    def __init__(self):
+        self.missions = MissionTable()
+        # steam id -> bitset of uncompleted missions
+        self.masks: Dict[int, int] = {}
+        # steam id -> uncompleted missions the bitset was built from, to skip rebuilding unchanged progress
+        self._sources: Dict[int, Dict[str, Set[str]]] = {}
+        # Incremented whenever a bitset changes
+        self.version = 0
+
+    def to_mask(self, uncompleted: Dict[str, Set[str]]) -> int:
+        mask = 0
+        for map_name, missions in uncompleted.items():
+            for mission in missions:
+                mask |= 1 << self.missions.bit(map_name, mission)
+        return mask
+
+    def update(self, steam_ids: Iterable[int], uncompleted_missions: Iterable[Optional[Dict[str, Set[str]]]]) -> None:
+        # None means the progress could not be loaded, the player keeps the bitset they already have
+        for steam_id, uncompleted in zip(steam_ids, uncompleted_missions):
+            if uncompleted is not None and self._sources.get(steam_id) is not uncompleted:
+                mask = self.to_mask(uncompleted)
+                if self.masks.get(steam_id) != mask:
+                    self.version += 1
+                self.masks[steam_id] = mask
+                self._sources[steam_id] = uncompleted
+
+    def retain(self, steam_ids: Set[int]) -> None:
+        # Forget players that are no longer needed, so the index doesn't grow forever
+        for steam_id in [s for s in self.masks if s not in steam_ids]:
+            del self.masks[steam_id]
+            del self._sources[steam_id]
+
+    def _masks_of(self, steam_ids: Iterable[int]) -> List[int]:
+        return [self.masks.get(steam_id, 0) for steam_id in steam_ids]
+
+    def demand(self, steam_ids: Iterable[int], map_name: str, mission: str) -> int:
+        # Number of the given players that still need the mission, doesn't add unknown missions to the table
+        bit = self.missions.bits.get((map_name, mission))
+        if bit is None:
+            return 0
+        return sum(1 for steam_id in steam_ids if (self.masks.get(steam_id, 0) >> bit) & 1)
+
+    def demand_per_mission(self, steam_ids: Iterable[int], map_name: str, missions: Iterable[str]) -> List[Tuple[str, int]]:
+        masks = self._masks_of(steam_ids)
+        result = []
+        for mission in missions:
+            bit = 1 << self.missions.bit(map_name, mission)
+            result.append((mission, sum(1 for mask in masks if mask & bit)))
+        return result
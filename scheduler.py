@@ -0,0 +1,32 @@
+from time import monotonic, sleep
+
+# Constants
+IDLE_BACKOFF_FACTOR = 1.5
+ERROR_BACKOFF_FACTOR = 2
+
+
+class PollScheduler:
+    def __init__(self, min_interval: float, max_interval: float):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._next_poll = monotonic()
+
+    def update(self, changed: bool, in_lobby: bool, error: bool = False) -> None:
+        # Poll as fast as possible while something is happening, and slowly back off while nothing changes
+        if error:
+            self.interval = min(self.max_interval, self.interval * ERROR_BACKOFF_FACTOR)
+        elif changed or in_lobby:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * IDLE_BACKOFF_FACTOR)
+
+    def wait(self) -> None:
+        # Polls are scheduled at a fixed rate, so the time spent fetching is not added on top of the interval
+        self._next_poll += self.interval
+        now = monotonic()
+        if self._next_poll < now:
+            # Don't try to catch up on missed polls after a slow iteration
+            self._next_poll = now
+        else:
+            sleep(self._next_poll - now)
@@ -2,3 +2,40 @@
 USER_STEAM_ID: int = 00000000000000000
 # Servers from the regions specified in this list will not be shown (e.g. ["SGP", "USTX", "USW"])
 IGNORED_REGIONS = []
+# Maximum number of player progress requests that are sent to potato.tf at the same time
+MAX_CONCURRENT_REQUESTS: int = 5
+# Number of seconds for which the loaded progress of a player is reused, and the number of players that are remembered
+PROGRESS_CACHE_TTL_IN_SECONDS: int = 300
+PROGRESS_CACHE_SIZE: int = 256
+# The server list is refreshed every MIN seconds while joinable wave 1 lobbies appear, disappear or change their
+# player count, or while you are on a server that is not in a wave, and slowly backs off to every MAX seconds
+# while nothing changes or potato.tf can't be reached
+MIN_REFRESH_DELAY_IN_SECONDS: int = 5
+MAX_REFRESH_DELAY_IN_SECONDS: int = 30
+# Only servers matching these lists are shown, an empty list shows everything
+# (e.g. ["EU", "USE"], ["Bigrock", "Decoy"], ["Advanced", "Expert"])
+ALLOWED_REGIONS = []
+ALLOWED_MAPS = []
+ALLOWED_DIFFICULTIES = []
+# Only servers with at least this many free player slots are shown
+MIN_FREE_SLOTS: int = 0
+# Sort servers by how many of their players still need the mission, this loads the progress of every player on
+# every shown server, so consider increasing PROGRESS_CACHE_SIZE when enabling it
+RANK_SERVERS: bool = False
+# Timing metrics: set a port (e.g. 9100) to serve them in Prometheus format on localhost, where /profile/start and
+# /profile/stop toggle the profiler, and/or set an interval to log them regularly. Both disabled: no metrics are kept.
+# The logged quantiles cover the last 5 minutes
+METRICS_PORT = None
+METRICS_LOG_INTERVAL_IN_SECONDS: int = 0
+# Record every polled server list in the history folder, for trends and replays with history.py.
+# Recordings older than HISTORY_DAYS_KEPT days are deleted
+RECORD_HISTORY: bool = False
+HISTORY_DAYS_KEPT: int = 30
+# Publish the newest server list to a shared memory block with this name (e.g. "potato_servers"), so other programs
+# can read it with SharedServerTable(name).read() from shared_table.py
+SHARED_TABLE_NAME = None
+# Replace notification sounds with your own files, the events are "new_server" and "server_full"
+# (e.g. {"new_server": "C:/Sounds/ding.mp3"})
+CUSTOM_SOUNDS = {}
+# A notification sound is played at most once within this many seconds
+MIN_SOUND_INTERVAL_IN_SECONDS: float = 2
@@ -0,0 +1,138 @@
+import struct
+from array import array
+from dataclasses import fields
+from multiprocessing import shared_memory
+from time import monotonic, sleep
+from typing import Dict, List, Optional
+
+from messages import *
+
+# Constants
+SHARED_TABLE_SIZE = 1024 * 1024
+# version, number of rows, length of the string table in bytes
+HEADER = struct.Struct('<QII')
+STRING_SEPARATOR = '\0'
+# A writer that was killed while publishing leaves an odd version behind, readers give up after this time
+READ_TIMEOUT_IN_SECONDS = 0.1
+
+COLUMNS = [f.name for f in fields(ServerData)]
+STRING_COLUMNS = {'server_name', 'region', 'map', 'mission', 'mission_name', 'status', 'address'}
+
+
+class StringTable:
+    # Stores every distinct string once, rows only store the index of their strings
+    def __init__(self, strings: Optional[List[str]] = None):
+        self.strings: List[str] = strings if strings is not None else []
+        self.ids: Dict[str, int] = {s: i for i, s in enumerate(self.strings)}
+
+    def intern(self, s: str) -> int:
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(s)
+            self.ids[s] = string_id
+        return string_id
+
+    def encode(self) -> bytes:
+        return STRING_SEPARATOR.join(self.strings).encode('utf-8')
+
+    @staticmethod
+    def decode(data: bytes) -> 'StringTable':
+        return StringTable(data.decode('utf-8').split(STRING_SEPARATOR) if len(data) > 0 else [])
+
+
+class ColumnTable:
+    # Column oriented server list with one int32 array per ServerData field
+    def __init__(self, row_count: int, columns: Dict[str, array], strings: StringTable, version: int = 0):
+        self.row_count = row_count
+        self.columns = columns
+        self.strings = strings
+        # Version of the shared table the columns were read from, readers can compare it to skip unchanged tables
+        self.version = version
+
+    @staticmethod
+    def from_server_data_list(servers: ServerDataList) -> 'ColumnTable':
+        strings = StringTable()
+        columns = {}
+        for name in COLUMNS:
+            values = (getattr(s, name) for s in servers.data)
+            columns[name] = array('i', map(strings.intern, values) if name in STRING_COLUMNS else map(int, values))
+        return ColumnTable(len(servers.data), columns, strings)
+
+    def row(self, i: int) -> ServerData:
+        return ServerData(*(self.strings.strings[self.columns[name][i]] if name in STRING_COLUMNS
+                            else bool(self.columns[name][i]) if name == 'completed'
+                            else self.columns[name][i]
+                            for name in COLUMNS))
+
+    def to_server_data_list(self) -> ServerDataList:
+        return ServerDataList([self.row(i) for i in range(self.row_count)])
+
+
+class SharedServerTable:
+    # Latest server list in a shared memory block, guarded by a version counter that is odd while it is written
+    def __init__(self, name: Optional[str] = None, create: bool = False, size: int = SHARED_TABLE_SIZE):
+        try:
+            self.memory = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        except FileExistsError:
+            # Left behind by a run that was killed
+            self.memory = shared_memory.SharedMemory(name=name)
+        if create:
+            HEADER.pack_into(self.memory.buf, 0, 0, 0, 0)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def version(self) -> int:
+        return HEADER.unpack_from(self.memory.buf, 0)[0]
+
+    def publish(self, servers: ServerDataList) -> bool:
+        # Returns False if the table doesn't fit in the shared memory block
+        table = ColumnTable.from_server_data_list(servers)
+        strings = table.strings.encode()
+        column_size = table.row_count * 4
+        if HEADER.size + column_size * len(COLUMNS) + len(strings) > self.memory.size:
+            return False
+
+        buf = self.memory.buf
+        version = self.version
+        HEADER.pack_into(buf, 0, version + 1, table.row_count, len(strings))
+        offset = HEADER.size
+        for name in COLUMNS:
+            buf[offset:offset + column_size] = table.columns[name].tobytes()
+            offset += column_size
+        buf[offset:offset + len(strings)] = strings
+        HEADER.pack_into(buf, 0, version + 2, table.row_count, len(strings))
+        return True
+
+    def read(self) -> Optional[ColumnTable]:
+        # Copies the columns without unpickling anything, returns None if nothing was published yet or if the table
+        # is still being written after READ_TIMEOUT_IN_SECONDS
+        deadline = monotonic() + READ_TIMEOUT_IN_SECONDS
+        while monotonic() < deadline:
+            version, row_count, strings_size = HEADER.unpack_from(self.memory.buf, 0)
+            if version == 0:
+                return None
+            if version % 2 == 1:
+                sleep(0)
+                continue
+            column_size = row_count * 4
+            columns = {}
+            offset = HEADER.size
+            for name in COLUMNS:
+                columns[name] = array('i')
+                columns[name].frombytes(self.memory.buf[offset:offset + column_size])
+                offset += column_size
+            strings_data = bytes(self.memory.buf[offset:offset + strings_size])
+            # Retry if the table was changed while it was copied
+            if self.version == version:
+                return ColumnTable(row_count, columns, StringTable.decode(strings_data), version)
+        return None
+
+    def close(self) -> None:
+        self.memory.close()
+
+    def unlink(self) -> None:
+        self.memory.unlink()
@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from dataclasses import astuple, dataclass, field
+from typing import Dict, Optional, Set
+
+from messages import *
+
+# Constants
+SNAPSHOT_FILE = "cache/snapshot.json"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Snapshot:
+    map_to_nice_name: Dict[str, str] = field(default_factory=dict)
+    mission_to_nice_name: Dict[str, str] = field(default_factory=dict)
+    user_uncompleted_missions: Dict[str, Set[str]] = field(default_factory=lambda: defaultdict(set))
+    servers: Optional[ServerDataList] = None
+
+
+def load_snapshot(path: str = SNAPSHOT_FILE) -> Snapshot:
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        uncompleted = defaultdict(set)
+        for map_name, missions in data['userUncompletedMissions'].items():
+            uncompleted[map_name] = set(missions)
+        servers = data['servers']
+        return Snapshot(data['mapToNiceName'],
+                        data['missionToNiceName'],
+                        uncompleted,
+                        ServerDataList([ServerData(*s) for s in servers]) if servers is not None else None)
+    except FileNotFoundError:
+        return Snapshot()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return Snapshot()
+
+
+def save_snapshot(snapshot: Snapshot, path: str = SNAPSHOT_FILE) -> None:
+    data = {'mapToNiceName': snapshot.map_to_nice_name,
+            'missionToNiceName': snapshot.mission_to_nice_name,
+            'userUncompletedMissions': {m: sorted(ms) for m, ms in list(snapshot.user_uncompleted_missions.items()) if ms},
+            # Servers are stored as rows instead of objects to keep the file small
+            'servers': [astuple(s) for s in snapshot.servers.data] if snapshot.servers is not None else None}
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Write to a temporary file first, so a crash never leaves a half written snapshot behind
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save snapshot {path}: {e}")
@@ -0,0 +1,141 @@
+import argparse
+import json
+import logging
+import socket
+import sys
+import threading
+from dataclasses import asdict, dataclass, field
+from time import time
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+import requests
+
+from messages import *
+from potato_checker import PotatoChecker, load_progress, load_servers, progress_cache
+from scheduler import PollScheduler
+from settings import *
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WatchedUser:
+    steam_id: int
+    uncompleted_missions: Dict[str, Set[str]] = field(default_factory=dict)
+    progress_loaded: bool = False
+    current_server: CurrentServerData = field(default_factory=CurrentServerData)
+
+
+class NdjsonBroadcaster:
+    # Writes one json object per line to a stream, and optionally to every client connected to a local tcp port
+    def __init__(self, stream: TextIO, port: Optional[int] = None):
+        self.stream = stream
+        self.clients: List[socket.socket] = []
+        self.clients_lock = threading.Lock()
+        if port is not None:
+            self.server_socket = socket.create_server(("127.0.0.1", port))
+            threading.Thread(target=self._accept_clients, daemon=True).start()
+
+    def _accept_clients(self) -> None:
+        while True:
+            client, _ = self.server_socket.accept()
+            with self.clients_lock:
+                self.clients.append(client)
+
+    def send(self, obj: Dict[str, Any]) -> None:
+        line = json.dumps(obj, separators=(',', ':'), default=sorted) + "\n"
+        self.stream.write(line)
+        self.stream.flush()
+        data = line.encode('utf-8')
+        with self.clients_lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    self.clients.remove(client)
+                    client.close()
+
+
+class WatchDaemon(PotatoChecker):
+    # Tracks the current server of several users with a single server status poll per tick
+    def __init__(self, steam_ids: Iterable[int], output: NdjsonBroadcaster):
+        super().__init__(None)
+        self.users = [WatchedUser(steam_id) for steam_id in steam_ids]
+        self.output = output
+
+    def _tick(self) -> Tuple[bool, bool]:
+        all_servers = load_servers()
+        # Every player is on at most one server, so this finds the server of every user without a scan
+        server_by_steam_id = {steam_id: s for s in all_servers for steam_id in s['steamIds']}
+
+        servers = [server_by_steam_id.get(user.steam_id) for user in self.users]
+        progress_changed = [self._progress_may_have_changed(server, user.current_server)
+                            for user, server in zip(self.users, servers)]
+        for user, changed in zip(self.users, progress_changed):
+            if changed:
+                progress_cache.invalidate(user.current_server.player_steam_ids | {user.steam_id})
+
+        # Load the progress of all users and players that need it in one deduplicated batch
+        needs_reload = [server is not None and (self._needs_reload(server, user.current_server, changed) or
+                                                self._failed_players_due(server))
+                        for user, server, changed in zip(self.users, servers, progress_changed)]
+        steam_ids = {user.steam_id for user, changed in zip(self.users, progress_changed)
+                     if changed or (not user.progress_loaded and self._may_retry(user.steam_id))}
+        for server, reload in zip(servers, needs_reload):
+            if reload:
+                steam_ids.update(server['steamIds'])
+        steam_ids = list(steam_ids)
+        progress = dict(zip(steam_ids, self._load_players_progress(steam_ids)))
+
+        any_changed = False
+        for user, server, reload in zip(self.users, servers, needs_reload):
+            # Users whose progress could not be loaded are retried on the next tick
+            if progress.get(user.steam_id) is not None:
+                user.uncompleted_missions = progress[user.steam_id]
+                user.progress_loaded = True
+
+            if server is None:
+                new_current_server = CurrentServerData()
+            elif reload:
+                new_current_server = self._to_current_server_data(
+                    server, self._count_needed_missions(server, user.steam_id, user.uncompleted_missions))
+            else:
+                new_current_server = self._to_current_server_data(server, user.current_server.uncompleted_missions)
+
+            if new_current_server != user.current_server:
+                self.output.send({'steamId': user.steam_id, 'time': time(), 'currentServer': asdict(new_current_server)})
+                any_changed = True
+            user.current_server = new_current_server
+
+        self.progress_index.retain({steam_id for s in all_servers for steam_id in s['steamIds']})
+        return any_changed, any(server is not None and server['status'] != 'In-Wave' for server in servers)
+
+    def mainloop(self) -> None:
+        scheduler = PollScheduler(MIN_REFRESH_DELAY_IN_SECONDS, MAX_REFRESH_DELAY_IN_SECONDS)
+        catalog_loaded = False
+
+        while True:
+            try:
+                if not catalog_loaded:
+                    # The progress of any user contains the nice names of all maps and missions
+                    self._update_catalog(load_progress(self.users[0].steam_id))
+                    catalog_loaded = True
+                changed, in_lobby = self._tick()
+                scheduler.update(changed, in_lobby)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                logger.warning(f"Could not load data from potato.tf: {e}")
+                scheduler.update(False, False, error=True)
+
+            scheduler.wait()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s", stream=sys.stderr)
+    parser = argparse.ArgumentParser(description="Streams the current server of several players as NDJSON")
+    parser.add_argument('steam_ids', metavar='STEAM_ID', type=int, nargs='*', default=[USER_STEAM_ID],
+                        help="SteamID64 of a player to watch (default: USER_STEAM_ID from settings.py)")
+    parser.add_argument('--port', type=int, default=None,
+                        help="also stream the updates to clients connecting to this port on localhost")
+    args = parser.parse_args()
+
+    WatchDaemon(args.steam_ids, NdjsonBroadcaster(sys.stdout, args.port)).mainloop()